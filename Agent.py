@@ -1,65 +1,168 @@
-from langchain_nvidia_ai_endpoints import ChatNVIDIA
-from langchain_tavily import TavilySearch
-from langchain.tools import tool
-from langgraph.prebuilt import ToolNode
-from langgraph.graph import StateGraph, MessagesState
 from langchain_core.messages import HumanMessage
-from langchain_core.messages import messages_from_dict, HumanMessage, SystemMessage
+from langchain_core.messages import messages_from_dict, HumanMessage, SystemMessage, AIMessage
 from langchain_core.runnables import Runnable
 from langchain_core.runnables import RunnableLambda
-from tools import get_site_kpi_extreme, get_peak_kpi_day_for_site, compare_kpi_impact, describe_kpi_dataset, kpi_anomalies
+from tools import get_site_kpi_extreme, get_kpi_leaderboard, get_peak_kpi_day_for_site, compare_kpi_impact, describe_kpi_dataset, kpi_anomalies, get_anomaly_cooccurrence, get_anomaly_precursors, get_top_anomalies
+from intent_router import route_question
+from answer_cache import answer_cache_from_env, is_self_contained
+from tools import data_version
+from tool_executor import run_in_thread
 import os
+import threading
 from dotenv import load_dotenv
 load_dotenv()
 
 nvidia_key = os.getenv("NVIDIA_API_KEY")
 tavily_key = os.getenv("TAVILY_API_KEY")
+# Set INTENT_ROUTER=0 to send every question through the LLM
+use_intent_router = os.getenv("INTENT_ROUTER", "1") != "0"
+# Set ANSWER_CACHE=0 to always run the agent for questions the router does not answer
+use_answer_cache = os.getenv("ANSWER_CACHE", "1") != "0"
 
+kpi_tools = [get_site_kpi_extreme, get_kpi_leaderboard, get_peak_kpi_day_for_site, compare_kpi_impact, describe_kpi_dataset, kpi_anomalies, get_anomaly_cooccurrence, get_anomaly_precursors, get_top_anomalies]
 
-# llm = ChatNVIDIA(model="nv-mistralai/mistral-nemo-12b-instruct", temperature=0.3, streaming=True)
+tools_by_name = {t.name: t for t in kpi_tools}
 
-# llm = ChatNVIDIA(model="moonshotai/kimi-k2-instruct", streaming=True)
 
-llm = ChatNVIDIA(model="meta/llama-3.1-70b-instruct", streaming=True, api_key=nvidia_key)
+def build_app():
+    """The LLM + tools graph. The NVIDIA / Tavily clients and langgraph are only imported here."""
+    from langchain_nvidia_ai_endpoints import ChatNVIDIA
+    from langchain_tavily import TavilySearch
+    from langgraph.prebuilt import ToolNode
+    from langgraph.graph import StateGraph, MessagesState
 
-search_tool = TavilySearch(max_results=3, tavily_api_key=tavily_key)
+    # llm = ChatNVIDIA(model="nv-mistralai/mistral-nemo-12b-instruct", temperature=0.3, streaming=True)
 
-all_tools = [search_tool, get_site_kpi_extreme, get_peak_kpi_day_for_site, compare_kpi_impact, describe_kpi_dataset, kpi_anomalies]
-llm_with_tools = llm.bind_tools(all_tools)
+    # llm = ChatNVIDIA(model="moonshotai/kimi-k2-instruct", streaming=True)
 
-tool_node = ToolNode(all_tools)
+    llm = ChatNVIDIA(model="meta/llama-3.1-70b-instruct", streaming=True, api_key=nvidia_key)
 
-def should_continue(state: MessagesState):
-    last = state["messages"][-1]
-    return "tools" if getattr(last, "tool_calls", None) else "__end__"
+    search_tool = TavilySearch(max_results=3, tavily_api_key=tavily_key)
 
-def call_model(state: MessagesState):
-    messages = state["messages"]
-    response = llm_with_tools.invoke(messages)
-    return {"messages": [response]}
+    all_tools = [search_tool] + kpi_tools
+    llm_with_tools = llm.bind_tools(all_tools)
 
-workflow = StateGraph(MessagesState)
-workflow.add_node("agent", call_model)
-workflow.add_node("tools", tool_node)
-workflow.set_entry_point("agent")
-workflow.add_conditional_edges("agent", should_continue)
-workflow.add_edge("tools", "agent")
-app = workflow.compile()
+    tool_node = ToolNode(all_tools)
 
+    def should_continue(state: MessagesState):
+        last = state["messages"][-1]
+        return "tools" if getattr(last, "tool_calls", None) else "__end__"
 
-agent_executor: Runnable = RunnableLambda(lambda x: app.invoke({
-    "messages": [
-        SystemMessage(content=(
-            "You are a helpful AI assistant specialized in telecom network analytics.\n"
-            "You have access to KPI data like SINR, throughput, drop rate, CPU utilization, etc.\n"
-            "You may use search tool or internal analytics tools to assist the user.\n"
-            "Explain clearly and professionally, and offer insights and summarize findings with detailed explanations."
-            "Always explain your reasoning clearly.\n"
-            "If uncertain, say 'I’m not sure' or suggest further data analysis.\n"
-            "Avoid making speculative conclusions."
-        ))
-    ] + messages_from_dict(x.get("chat_history", [])) + [HumanMessage(content=x["input"])]
-}))
+    def call_model(state: MessagesState):
+        messages = state["messages"]
+        response = llm_with_tools.invoke(messages)
+        return {"messages": [response]}
+
+    async def acall_model(state: MessagesState):
+        messages = state["messages"]
+        response = await llm_with_tools.ainvoke(messages)
+        return {"messages": [response]}
+
+    # Under ainvoke/astream the ToolNode awaits all tool calls of a turn together (see tool_executor.py)
+    workflow = StateGraph(MessagesState)
+    workflow.add_node("agent", RunnableLambda(call_model, afunc=acall_model))
+    workflow.add_node("tools", tool_node)
+    workflow.set_entry_point("agent")
+    workflow.add_conditional_edges("agent", should_continue)
+    workflow.add_edge("tools", "agent")
+    return workflow.compile()
+
+
+_app = None
+_app_lock = threading.Lock()
+
+
+def get_app():
+    """The compiled graph, built on the first question the router and the answer cache cannot answer."""
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = build_app()
+    return _app
+
+system_prompt = SystemMessage(content=(
+    "You are a helpful AI assistant specialized in telecom network analytics.\n"
+    "You have access to KPI data like SINR, throughput, drop rate, CPU utilization, etc.\n"
+    "You may use search tool or internal analytics tools to assist the user.\n"
+    "Explain clearly and professionally, and offer insights and summarize findings with detailed explanations."
+    "Always explain your reasoning clearly.\n"
+    "If uncertain, say 'I’m not sure' or suggest further data analysis.\n"
+    "Avoid making speculative conclusions."
+))
+
+
+def routed_answer(question: str):
+    """Output of the return_direct tool the intent router maps `question` to, or None."""
+    intent = route_question(question) if use_intent_router else None
+    if intent is None:
+        return None
+    output = tools_by_name[intent.tool].invoke(intent.args)
+    # Let the agent handle anything the tool could not answer
+    return None if output.startswith("Error") else output
+
+
+async def arouted_answer(question: str):
+    # The first question loads the KPI vocabulary from the data files
+    intent = await run_in_thread(route_question, question) if use_intent_router else None
+    if intent is None:
+        return None
+    output = await tools_by_name[intent.tool].ainvoke(intent.args)
+    return None if output.startswith("Error") else output
+
+
+answer_cache = answer_cache_from_env()
+
+
+def _cached_answer(x: dict):
+    """`(cacheable, version, cached answer or None)` for a question the router did not answer."""
+    cacheable = use_answer_cache and is_self_contained(x["input"], x.get("chat_history"))
+    version = data_version()
+    return cacheable, version, answer_cache.get(x["input"], version) if cacheable else None
+
+
+def _store_answer(x: dict, version, result: dict):
+    last_ai = next((msg for msg in reversed(result["messages"]) if msg.type == "ai"), None)
+    if last_ai is not None and not getattr(last_ai, "tool_calls", None):
+        answer_cache.put(x["input"], version, last_ai.content)
+
+
+def run_agent(x: dict) -> dict:
+    messages = [system_prompt] + messages_from_dict(x.get("chat_history", [])) + [HumanMessage(content=x["input"])]
+    output = routed_answer(x["input"])
+    if output is not None:
+        return {"messages": messages + [AIMessage(content=output)]}
+
+    cacheable, version, cached = _cached_answer(x)
+    if cached is not None:
+        return {"messages": messages + [AIMessage(content=cached)]}
+
+    result = get_app().invoke({"messages": messages})
+    if cacheable:
+        _store_answer(x, version, result)
+    return result
+
+
+async def arun_agent(x: dict) -> dict:
+    messages = [system_prompt] + messages_from_dict(x.get("chat_history", [])) + [HumanMessage(content=x["input"])]
+    output = await arouted_answer(x["input"])
+    if output is not None:
+        return {"messages": messages + [AIMessage(content=output)]}
+
+    # Cache lookups / stores may encode the question with the embedding model,
+    # and the first get_app() imports the LLM clients and builds the graph
+    cacheable, version, cached = await run_in_thread(_cached_answer, x)
+    if cached is not None:
+        return {"messages": messages + [AIMessage(content=cached)]}
+
+    app = await run_in_thread(get_app)
+    result = await app.ainvoke({"messages": messages})
+    if cacheable:
+        await run_in_thread(_store_answer, x, version, result)
+    return result
+
+
+agent_executor: Runnable = RunnableLambda(run_agent, afunc=arun_agent)
 
 if __name__ == "__main__":
     while True:
@@ -19,8 +19,8 @@ class ChatOutput(BaseModel):
     output: str
 
 @app.post("/mcp/invoke", response_model=ChatOutput, operation_id="Get_Agent")
-def invoke_agent(input: ChatInput):
-    result = agent_executor.invoke({
+async def invoke_agent(input: ChatInput):
+    result = await agent_executor.ainvoke({
         "input": input.input,
         "chat_history": input.chat_history
     })
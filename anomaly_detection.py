@@ -0,0 +1,938 @@
+"""
+Anomaly detection pipeline from Anomaly_Detection.ipynb as an importable module.
+
+    python anomaly_detection.py                  # cleaned KPI data -> Data/df_*.csv + Data/anomaly_scores.npz
+    python anomaly_detection.py --workers 8
+    python anomaly_detection.py --raw Data/AD_data_10KPI.csv   # clean the raw export first
+    python anomaly_detection.py --raw big.csv --chunksize 500000   # clean a larger-than-memory export
+    python anomaly_detection.py --save-state     # full run that also keeps state for --append
+    python anomaly_detection.py --append new_day.csv   # score only newly arrived rows
+    python anomaly_detection.py --if-mode sector # one multivariate forest per sector
+
+Cleaning resolves every KPI's bounds first (resolve_domain_bounds: fixed
+limits and upper percentiles, the latter over the rows that survive the
+earlier rules, as in the notebook) and then applies them as one boolean mask
+(domain_outlier_mask), reporting how many rows each rule removed. With
+--chunksize the raw CSV is streamed twice instead of loaded: the percentiles
+come from a uniform row sample of CLEANING_SAMPLE_ROWS rows (exact when the
+file is smaller), the mask is applied chunk by chunk and the kept rows are
+sorted by (Sector_ID, Date) one sector at a time (clean_kpi_csv), so the
+output has the same row order as the in-memory path.
+
+The cleaned KPI frame is grouped by Sector_ID once and scored once
+(compute_scores): DWT-MLEAD residual z-scores come from a (sectors x days)
+matrix per KPI with one wavelet call per series length, and one Isolation
+Forest per (sector, KPI) series is fitted in a process pool. The DWT, IF and
+ensemble flag sets are thresholds over those scores (dwt_flags, if_flags,
+ensemble_flags), so trying another threshold or contamination level does not
+refit anything.
+
+Besides the flagged-row CSVs, every scored point (DWT z-scores, IF score and
+ensemble vote) is saved to Data/anomaly_scores.npz, which tools.py loads to
+rank or re-threshold anomalies without rerunning detection.
+
+With --if-mode sector or global the forest scores whole days (the 10-KPI
+vector) instead of single values, one fit per sector or one in total, and
+every day's score is attributed back to the KPIs by how much it recovers when
+that KPI is reset to the sector median (multivariate_scores). The flagged
+rows keep the df_*.csv layout: one row per (day, KPI) the anomaly is
+attributed to.
+
+Fitted forests are cached on disk (model_cache.py, Data/if_models/) under a
+key of their parameters and training values, so a rerun only fits the series
+whose data changed; --no-model-cache always refits.
+
+Incremental mode (--append) keeps, per (sector, KPI), a window of the last
+ONLINE_WINDOW_DAYS values and the cache key of the fitted forest (in
+Data/online_state/). Only sectors that received rows are loaded and rescored,
+and the new rows and their ensemble anomalies are appended to the cleaned KPI
+CSV and df_ensemble.csv.
+
+Run `python build_cache.py` afterwards to refresh the .npz sidecars.
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+import pywt
+from scipy.stats import zscore
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import MinMaxScaler
+
+from model_cache import MODEL_CACHE_DIR, model_cache
+
+RAW_CSV_PATH = os.path.join("Data", "AD_data_10KPI.csv")
+CLEANED_CSV_PATH = os.path.join("Data", "KPI_data_cleaned.csv")
+DWT_CSV_PATH = os.path.join("Data", "df_dwt.csv")
+IF_CSV_PATH = os.path.join("Data", "df_if.csv")
+ENSEMBLE_CSV_PATH = os.path.join("Data", "df_ensemble.csv")
+SCORES_PATH = os.path.join("Data", "anomaly_scores.npz")
+ONLINE_STATE_DIR = os.path.join("Data", "online_state")
+
+# Days of history kept per (sector, KPI) for incremental DWT-MLEAD scoring
+ONLINE_WINDOW_DAYS = 60
+
+CATEGORY_COLUMNS = ['KPI', 'Site_ID', 'Sector_ID']
+
+KPI_COLS = ['RSRP', 'DL_Throughput', 'Call_Drop_Rate', 'RTT', 'CPU_Utilization',
+            'Active_Users', 'SINR', 'UL_Throughput', 'Handover_Success_Rate', 'Packet_Loss']
+
+# KPI groups
+DWT_KPIS = ['DL_Throughput', 'UL_Throughput', 'RTT', 'SINR', 'RSRP']
+IF_KPIS = ['CPU_Utilization', 'Handover_Success_Rate', 'Call_Drop_Rate', 'Packet_Loss', 'Active_Users']
+
+# Sectors with fewer days than this are skipped
+MIN_SECTOR_DAYS = 10
+
+# Default detector settings (DWT threshold factor, IF contamination)
+DWT_THRESHOLD = 2.5
+IF_CONTAMINATION = 0.03
+ENSEMBLE_DWT_THRESHOLD = 2
+ENSEMBLE_CONTAMINATION = 0.05
+
+# Rows sampled to estimate cleaning percentiles in the chunked mode
+CLEANING_SAMPLE_ROWS = 1_000_000
+
+# Isolation Forest modes: one forest per (sector, KPI) series, one per sector
+# on the KPI vector, or one for all sectors on sector-normalized KPI vectors
+IF_MODES = ("univariate", "sector", "global")
+# In the multivariate modes a flagged day counts as an anomaly of a KPI only if
+# that KPI carries at least this share of the day's attribution
+IF_ATTRIBUTION_SHARE = 0.25
+IF_RANDOM_STATE = 42
+
+
+def define_kpi_bounds():
+    """
+    Define realistic bounds for each KPI based on telecom domain knowledge
+    """
+    kpi_bounds = {
+        'RSRP': {'lower': -120, 'upper_percentile': 97},  # Signal strength (dBm)
+        'DL_Throughput': {'lower': 0, 'upper_percentile': 98},  # Mbps
+        'Call_Drop_Rate': {'lower': 0, 'upper_percentile': 98},  # Percentage
+        'RTT': {'lower': 0, 'upper_percentile': 97},  # Milliseconds
+        'CPU_Utilization': {'lower': 0, 'upper': 100},  # Percentage
+        'Active_Users': {'lower': 0, 'upper_percentile': 98},  # Count
+        'SINR': {'lower': -10, 'upper_percentile': 97},  # dB
+        'UL_Throughput': {'lower': 0, 'upper_percentile': 98},  # Mbps
+        'Handover_Success_Rate': {'lower': 0, 'upper_percentile': 98},  # Percentage
+        'Packet_Loss': {'lower': 0, 'upper_percentile': 97}  # Percentage
+    }
+    return kpi_bounds
+
+
+def resolve_domain_bounds(df: pd.DataFrame, kpi_bounds: dict, sequential: bool = True) -> dict:
+    """
+    `{kpi: (lower, upper)}` with every `upper_percentile` turned into a value
+    (None where a KPI has no bound on that side), in `kpi_bounds` order.
+
+    With `sequential=True` each percentile is taken over the rows that pass
+    all earlier rules, which is what filtering the frame KPI by KPI (the
+    notebook) does; otherwise every percentile is over all rows of `df`. Works
+    on one float matrix and a running mask, without copying the frame.
+    """
+    values = df[list(kpi_bounds)].to_numpy(dtype=np.float64)
+    keep = np.ones(len(values), dtype=bool)
+    resolved = {}
+    with np.errstate(invalid='ignore'):
+        for i, (kpi, bounds) in enumerate(kpi_bounds.items()):
+            column = values[:, i]
+            lower = bounds.get('lower')
+            if sequential and lower is not None:
+                keep &= column >= lower
+            upper = bounds.get('upper')
+            if upper is None and 'upper_percentile' in bounds:
+                population = column[keep] if sequential else column
+                population = population[~np.isnan(population)]
+                upper = float(np.quantile(population, bounds['upper_percentile'] / 100.0)) if len(population) else np.nan
+            if sequential and upper is not None:
+                keep &= column <= upper
+            resolved[kpi] = (lower, upper)
+    return resolved
+
+
+def domain_outlier_mask(df: pd.DataFrame, resolved_bounds: dict):
+    """
+    One boolean mask of the rows of `df` within all `resolved_bounds` (see
+    resolve_domain_bounds; a missing value fails every rule of its KPI), plus a
+    report with one row per rule: KPI, rule ("lower" / "upper"), bound,
+    `violations` (rows outside the bound) and `removed` (rows outside it that
+    no earlier rule removed, so `removed` sums to the rows dropped).
+    """
+    keep = np.ones(len(df), dtype=bool)
+    report = []
+    with np.errstate(invalid='ignore'):
+        for kpi, (lower, upper) in resolved_bounds.items():
+            column = df[kpi].to_numpy(dtype=np.float64)
+            for rule, bound, inside in [("lower", lower, lambda: column >= lower),
+                                        ("upper", upper, lambda: column <= upper)]:
+                if bound is None:
+                    continue
+                outside = ~inside()
+                report.append({"KPI": kpi, "rule": rule, "bound": bound,
+                               "violations": int(outside.sum()), "removed": int((keep & outside).sum())})
+                keep &= ~outside
+    return keep, pd.DataFrame(report, columns=["KPI", "rule", "bound", "violations", "removed"])
+
+
+def clean_kpi_frame(df: pd.DataFrame, kpi_bounds: dict, sequential: bool = True):
+    """`(cleaned rows of df, per-rule report)`; see resolve_domain_bounds and domain_outlier_mask."""
+    mask, report = domain_outlier_mask(df, resolve_domain_bounds(df, kpi_bounds, sequential))
+    return df[mask], report
+
+
+def remove_domain_outliers(df, kpi_bounds):
+    """
+    Remove KPI outliers based on domain-specific lower bounds and upper percentiles or fixed thresholds.
+    """
+    return clean_kpi_frame(df, kpi_bounds)[0]
+
+
+def _read_raw_chunks(csv_path: str, chunksize: int):
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize, float_precision="round_trip"):
+        chunk[KPI_COLS] = chunk[KPI_COLS].apply(pd.to_numeric, errors='coerce')
+        yield chunk
+
+
+def clean_kpi_csv(csv_path: str, output_path: str, kpi_bounds: dict, chunksize: int = 500_000,
+                  sequential: bool = True, sample_rows: int = CLEANING_SAMPLE_ROWS,
+                  random_state: int = 0) -> pd.DataFrame:
+    """
+    Cleans a raw KPI CSV of any size into `output_path` in two streaming passes
+    of `chunksize` rows and returns the per-rule report.
+
+    The first pass keeps a uniform sample of `sample_rows` rows (the rows with
+    the smallest random keys), from which resolve_domain_bounds estimates the
+    percentiles; the sample is the whole file when it is smaller, and then the
+    bounds are exact. The second pass applies the bounds to every chunk and
+    appends the kept rows to one temporary file per sector; the sectors are
+    then written to `output_path` in Sector_ID order, each sorted by Date
+    (stable, as load_raw_kpi_data sorts), so only one sector is in memory at a
+    time.
+    """
+    rng = np.random.default_rng(random_state)
+    sample, sample_keys = None, np.zeros(0)
+    for chunk in _read_raw_chunks(csv_path, chunksize):
+        keys = rng.random(len(chunk))
+        sample = chunk if sample is None else pd.concat([sample, chunk], ignore_index=True)
+        sample_keys = np.concatenate([sample_keys, keys])
+        if len(sample) > sample_rows:
+            keep = np.argpartition(sample_keys, sample_rows - 1)[:sample_rows]
+            sample, sample_keys = sample.iloc[keep].reset_index(drop=True), sample_keys[keep]
+    if sample is None:
+        raise ValueError(f"{csv_path} has no rows")
+    resolved = resolve_domain_bounds(sample, kpi_bounds, sequential)
+
+    report = None
+    parts = {}
+    parts_dir = tempfile.mkdtemp(prefix=os.path.basename(output_path) + ".", dir=os.path.dirname(output_path) or ".")
+    try:
+        for chunk in _read_raw_chunks(csv_path, chunksize):
+            mask, chunk_report = domain_outlier_mask(chunk, resolved)
+            for sector_id, rows in chunk[mask].groupby('Sector_ID', sort=False, dropna=False):
+                path = parts.get(sector_id)
+                if path is None:
+                    path = parts[sector_id] = os.path.join(parts_dir, f"{len(parts)}.csv")
+                rows.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+            if report is None:
+                report = chunk_report
+            else:
+                report[["violations", "removed"]] += chunk_report[["violations", "removed"]].to_numpy()
+
+        tmp_path = output_path + ".tmp"
+        header = True
+        # Same order as sort_values: sectors ascending, missing IDs last
+        for sector_id in sorted(parts, key=lambda s: (pd.isna(s), str(s))):
+            rows = pd.read_csv(parts[sector_id], parse_dates=["Date"], float_precision="round_trip")
+            rows.sort_values('Date', kind='stable').to_csv(tmp_path, mode='w' if header else 'a', header=header,
+                                                          index=False)
+            header = False
+        if header:
+            pd.DataFrame(columns=sample.columns).to_csv(tmp_path, index=False)
+        os.replace(tmp_path, output_path)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    return report
+
+
+def load_raw_kpi_data(csv_path: str = RAW_CSV_PATH) -> pd.DataFrame:
+    """Raw KPI export with typed Date / KPI columns, sorted by (Sector_ID, Date)."""
+    df = pd.read_csv(csv_path, parse_dates=["Date"])
+    df[KPI_COLS] = df[KPI_COLS].apply(pd.to_numeric, errors='coerce')
+    return df.sort_values(by=['Sector_ID', 'Date']).reset_index(drop=True)
+
+
+def dwt_mlead_anomaly_detection(series, wavelet='db4', level=3, threshold_factor=2):
+    scaler = MinMaxScaler()
+    scaled_series = scaler.fit_transform(series.values.reshape(-1, 1)).flatten()
+    coeffs = pywt.wavedec(scaled_series, wavelet, level=level)
+    detail_coeffs = np.hstack(coeffs[1:])
+    threshold = threshold_factor * np.std(detail_coeffs)
+    thresholded_coeffs = [coeffs[0]] + [pywt.threshold(c, threshold, mode='soft') for c in coeffs[1:]]
+    reconstructed = pywt.waverec(thresholded_coeffs, wavelet)
+    reconstructed = reconstructed[:len(scaled_series)]
+    residual = scaled_series - reconstructed
+    residual_z = zscore(residual)
+    anomaly_indices = np.where(np.abs(residual_z) > threshold_factor)[0]
+    return anomaly_indices, residual_z
+
+
+def dwt_mlead_batch(values, lengths, wavelet='db4', level=3, threshold_factor=2):
+    """
+    Batched dwt_mlead_anomaly_detection over many series at once.
+
+    `values` is a (series, days) matrix with each series left-aligned and
+    `lengths` its number of valid days; cells past a row's length are ignored.
+    Series of equal length go through MinMaxScaler-style scaling, wavedec, soft
+    thresholding, waverec and the residual z-score together along the last axis,
+    so the wavelet boundary handling is the same as for the single series.
+    Returns the residual z-scores as a matrix shaped like `values`, NaN past
+    each row's length.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    lengths = np.asarray(lengths)
+    residual_z = np.full(values.shape, np.nan)
+
+    for length in np.unique(lengths[lengths > 0]):
+        rows = np.flatnonzero(lengths == length)
+        series = values[rows, :length]
+
+        # Same arithmetic as MinMaxScaler (zero ranges scale by 1)
+        with np.errstate(all='ignore'):
+            data_min = np.nanmin(series, axis=1, keepdims=True)
+            data_range = np.nanmax(series, axis=1, keepdims=True) - data_min
+        data_range[data_range == 0.0] = 1.0
+        scale = 1.0 / data_range
+        scaled = series * scale - data_min * scale
+
+        coeffs = pywt.wavedec(scaled, wavelet, level=level, axis=-1)
+        threshold = threshold_factor * np.std(np.hstack(coeffs[1:]), axis=1, keepdims=True)
+        thresholded_coeffs = [coeffs[0]] + [pywt.threshold(c, threshold, mode='soft') for c in coeffs[1:]]
+        reconstructed = pywt.waverec(thresholded_coeffs, wavelet, axis=-1)[:, :length]
+        with np.errstate(all='ignore'):
+            residual_z[rows, :length] = zscore(scaled - reconstructed, axis=1)
+
+    return residual_z
+
+
+def isolation_forest_anomaly_detection(series, contamination, random_state):
+    valid_values = series.dropna().values.reshape(-1, 1)
+    model = IsolationForest(n_estimators=100, contamination=contamination, random_state=random_state)
+    preds = model.fit_predict(valid_values)
+    return np.where(preds == -1)[0]
+
+
+def isolation_forest_scores(series, random_state=IF_RANDOM_STATE, return_model=False,
+                            cache=None, sector_id=None, kpi=None):
+    """
+    IsolationForest.score_samples of every non-NaN value of one series (NaN
+    elsewhere). Lower is more anomalous; contamination only moves the cut-off,
+    so one fit serves every contamination level (see if_flags). With an
+    IFModelCache the forest of (sector_id, kpi) is loaded from / stored in it.
+    With `return_model=True` returns `(scores, model, key)`; model and key are
+    None for an all-NaN series, key also without a cache.
+    """
+    values = np.asarray(series, dtype=np.float64)
+    scores = np.full(len(values), np.nan)
+    valid = ~np.isnan(values)
+    model, key = None, None
+    if valid.any():
+        if cache is None:
+            model = IsolationForest(n_estimators=100, random_state=random_state).fit(values[valid].reshape(-1, 1))
+        else:
+            model, key = cache.fit(sector_id, kpi, values[valid], n_estimators=100, random_state=random_state)
+        scores[valid] = model.score_samples(values[valid].reshape(-1, 1))
+    return (scores, model, key) if return_model else scores
+
+
+def isolation_forest_sector(sector_df: pd.DataFrame, model_cache_dir: Optional[str] = None):
+    """
+    Isolation Forest scores of every KPI of one sector as `({kpi: scores},
+    {kpi: model key})`. Forests go through the model cache in
+    `model_cache_dir` (keys are only returned then). KPIs whose fit fails are
+    left out.
+    """
+    warnings.filterwarnings("ignore")
+    cache = model_cache(model_cache_dir) if model_cache_dir is not None else None
+    sector_id = sector_df['Sector_ID'].iloc[0]
+    results, keys = {}, {}
+    for kpi in KPI_COLS:
+        try:
+            results[kpi], _, key = isolation_forest_scores(
+                sector_df[kpi], return_model=True, cache=cache, sector_id=sector_id, kpi=kpi
+            )
+        except Exception:
+            continue
+        if key is not None:
+            keys[kpi] = key
+    return results, keys
+
+
+def _isolation_forest_sectors(sector_frames, model_cache_dir=None):
+    return [isolation_forest_sector(sector_df, model_cache_dir) for sector_df in sector_frames]
+
+
+def sector_features(sector_df: pd.DataFrame, kpis=KPI_COLS) -> np.ndarray:
+    """
+    (days, KPIs) matrix of one sector, robust-scaled per KPI to (value - median)
+    / IQR over the sector's own history, with missing values at 0 (the median).
+    Makes sectors comparable for one global forest; a per-sector forest is
+    unaffected by the scaling.
+    """
+    values = sector_df[kpis].to_numpy(dtype=np.float64, copy=True)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        center = np.nanmedian(values, axis=0)
+        q1, q3 = np.nanpercentile(values, [25, 75], axis=0)
+    scale = q3 - q1
+    scale[~(scale > 0)] = 1.0
+    features = (values - center) / scale
+    features[np.isnan(features)] = 0.0
+    return features
+
+
+def multivariate_scores(model, features: np.ndarray):
+    """
+    score_samples of every row of `features` and its per-KPI attribution as
+    `(scores, attribution)`. KPI j's raw contribution to a row is how much the
+    score rises when feature j is reset to 0 (the sector median); attribution
+    holds the positive contributions normalized to sum to 1 per row (all 0 when
+    no single KPI explains the score).
+    """
+    scores = model.score_samples(features)
+    gain = np.empty_like(features)
+    for j in range(features.shape[1]):
+        ablated = features.copy()
+        ablated[:, j] = 0.0
+        gain[:, j] = model.score_samples(ablated) - scores
+    gain = np.clip(gain, 0.0, None)
+    total = gain.sum(axis=1, keepdims=True)
+    return scores, np.divide(gain, total, out=np.zeros_like(gain), where=total > 0)
+
+
+def _fit_multivariate(features: np.ndarray, model_cache_dir: Optional[str], sector_id: str):
+    """`(model, cache key)`; the key is None without a model cache."""
+    params = dict(n_estimators=100, random_state=IF_RANDOM_STATE)
+    if model_cache_dir is None:
+        return IsolationForest(**params).fit(features), None
+    return model_cache(model_cache_dir).fit(sector_id, "multivariate", features, **params)
+
+
+def multivariate_sector(sector_df: pd.DataFrame, model_cache_dir: Optional[str] = None, return_key: bool = False):
+    """
+    One Isolation Forest on the sector's KPI vectors; returns multivariate_scores
+    of its days (plus the model cache key with `return_key`).
+    """
+    warnings.filterwarnings("ignore")
+    features = sector_features(sector_df)
+    model, key = _fit_multivariate(features, model_cache_dir, sector_df['Sector_ID'].iloc[0])
+    scores, attribution = multivariate_scores(model, features)
+    return (scores, attribution, key) if return_key else (scores, attribution)
+
+
+def _multivariate_sectors(sector_frames, model_cache_dir=None):
+    return [multivariate_sector(sector_df, model_cache_dir, return_key=True) for sector_df in sector_frames]
+
+
+def _map_chunks(fn, chunks, workers):
+    """fn over every chunk in `workers` processes (in this process with workers=1), results flattened."""
+    if workers == 1:
+        return [r for chunk in chunks for r in fn(chunk)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [r for chunk_results in pool.map(fn, chunks) for r in chunk_results]
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def sector_matrix(sector_frames, kpi):
+    """(sectors, max days) matrix of `kpi` with every sector's rows left-aligned, and the row counts."""
+    lengths = np.array([len(sector_df) for sector_df in sector_frames])
+    values = np.full((len(sector_frames), lengths.max(initial=0)), np.nan)
+    for i, sector_df in enumerate(sector_frames):
+        values[i, :lengths[i]] = sector_df[kpi].to_numpy(dtype=np.float64)
+    return values, lengths
+
+
+def dwt_column(threshold_factor) -> str:
+    return f"dwt_z_{threshold_factor:g}"
+
+
+def compute_scores(df_cleaned: pd.DataFrame, workers: int = None, chunk_size: int = 32,
+                   dwt_factors=(DWT_THRESHOLD, ENSEMBLE_DWT_THRESHOLD),
+                   model_cache_dir: Optional[str] = MODEL_CACHE_DIR,
+                   model_keys: Optional[dict] = None, if_mode: str = "univariate") -> pd.DataFrame:
+    """
+    Continuous anomaly scores of every (sector, KPI, day), computed once.
+
+    Returns a long frame sorted by (KPI in KPI_COLS order, Sector_ID, Date) with
+    KPI, Site_ID, Sector_ID, Date, Value, `if_score` (IsolationForest
+    score_samples of the sector's series) and one DWT-MLEAD residual z-score
+    column per denoising factor in `dwt_factors` (see dwt_column). Sectors with
+    fewer than MIN_SECTOR_DAYS rows are left out. DWT runs batched in this
+    process; the forest fits are spread over `workers` processes (in this
+    process with workers=1). Forests are loaded from / saved to the model
+    cache in `model_cache_dir` (None refits everything); if a `model_keys`
+    dict is given, the cache key of every forest is stored in it by
+    (Sector_ID, KPI).
+
+    With `if_mode` "sector" (one forest per sector) or "global" (one forest
+    over sector_features of all sectors) `if_score` is the score of the whole
+    day, repeated for every KPI with a value, and an extra `if_attribution`
+    column holds the KPI's share of it (see multivariate_scores); their keys
+    go into model_keys under (Sector_ID or "__global__", "multivariate").
+    """
+    if if_mode not in IF_MODES:
+        raise ValueError(f"Unknown if_mode {if_mode!r}; expected one of {', '.join(IF_MODES)}")
+    df_cleaned = df_cleaned.sort_values(by=['Sector_ID', 'Date'], kind='stable')
+    sector_frames = [
+        sector_df.reset_index(drop=True) for _, sector_df in df_cleaned.groupby('Sector_ID', sort=True)
+        if len(sector_df) >= MIN_SECTOR_DAYS
+    ]
+    chunks = _chunks(sector_frames, chunk_size)
+
+    rows = pd.concat(sector_frames, ignore_index=True) if sector_frames else df_cleaned.iloc[:0]
+    lengths = np.array([len(sector_df) for sector_df in sector_frames])
+    valid = np.arange(lengths.max(initial=0)) < lengths[:, None]
+
+    day_scores = attribution = None
+    if if_mode == "univariate":
+        fitted = _map_chunks(partial(_isolation_forest_sectors, model_cache_dir=model_cache_dir), chunks, workers)
+        forests = [forest for forest, _ in fitted]
+        if model_keys is not None:
+            for sector_df, (_, sector_keys) in zip(sector_frames, fitted):
+                model_keys.update({(sector_df['Sector_ID'].iloc[0], kpi): key for kpi, key in sector_keys.items()})
+    elif if_mode == "sector":
+        fitted = _map_chunks(partial(_multivariate_sectors, model_cache_dir=model_cache_dir), chunks, workers)
+        day_scores = np.concatenate([s for s, _, _ in fitted]) if fitted else np.zeros(0)
+        attribution = np.concatenate([a for _, a, _ in fitted]) if fitted else np.zeros((0, len(KPI_COLS)))
+        if model_keys is not None:
+            for sector_df, (_, _, key) in zip(sector_frames, fitted):
+                if key is not None:
+                    model_keys[(sector_df['Sector_ID'].iloc[0], "multivariate")] = key
+    elif sector_frames:
+        features = np.concatenate([sector_features(sector_df) for sector_df in sector_frames])
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            model, key = _fit_multivariate(features, model_cache_dir, "__global__")
+            day_scores, attribution = multivariate_scores(model, features)
+        if model_keys is not None and key is not None:
+            model_keys[("__global__", "multivariate")] = key
+    else:
+        day_scores, attribution = np.zeros(0), np.zeros((0, len(KPI_COLS)))
+
+    blocks = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for kpi in KPI_COLS:
+            block = rows[['Site_ID', 'Sector_ID', 'Date']].copy()
+            block.insert(0, 'KPI', kpi)
+            block['Value'] = rows[kpi].to_numpy(dtype=np.float64)
+            if day_scores is None:
+                block['if_score'] = np.concatenate(
+                    [forest.get(kpi, np.full(n, np.nan)) for forest, n in zip(forests, lengths)]
+                ) if len(forests) else np.zeros(0)
+            else:
+                block['if_score'] = np.where(np.isnan(block['Value'].to_numpy()), np.nan, day_scores)
+                block['if_attribution'] = attribution[:, KPI_COLS.index(kpi)]
+            values, _ = sector_matrix(sector_frames, kpi)
+            for factor in dwt_factors:
+                block[dwt_column(factor)] = dwt_mlead_batch(values, lengths, threshold_factor=factor)[valid]
+            blocks.append(block)
+    return pd.concat(blocks, ignore_index=True)
+
+
+def _group_percentile(scores: pd.DataFrame, column: str, q: float) -> np.ndarray:
+    """
+    np.percentile(..., q) of `column` within every (KPI, Sector_ID) group, over
+    the group's non-NaN values, broadcast back to the rows. Uses numpy's linear
+    interpolation formula so cut-offs equal what IsolationForest computes.
+    """
+    group = scores.groupby(['KPI', 'Sector_ID'], sort=False, observed=True).ngroup().to_numpy()
+    values = scores[column].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return np.full(len(values), np.nan)
+    sorted_values = values[valid][np.lexsort((values[valid], group[valid]))]
+    n = np.bincount(group[valid], minlength=group.max() + 1)
+    starts = np.concatenate([[0], np.cumsum(n)[:-1]])
+
+    # numpy's "linear" method: virtual index (n - 1) * q, then a lerp that is exact at both ends
+    q = np.true_divide(q, 100)
+    virtual = (n - 1) * q
+    previous = np.floor(virtual)
+    gamma = virtual - previous
+    last = np.maximum(n - 1, 0)
+    a = sorted_values[np.minimum(starts + np.clip(previous.astype(np.int64), 0, last), len(sorted_values) - 1)]
+    b = sorted_values[np.minimum(starts + np.clip(previous.astype(np.int64) + 1, 0, last), len(sorted_values) - 1)]
+    diff_b_a = b - a
+    cut = np.where(gamma >= 0.5, b - diff_b_a * (1 - gamma), a + diff_b_a * gamma)
+    cut[n == 0] = np.nan
+    return cut[group]
+
+
+def dwt_flags(scores: pd.DataFrame, threshold_factor: float = DWT_THRESHOLD) -> np.ndarray:
+    """DWT-MLEAD anomalies (|residual z| above `threshold_factor`, denoised with the same factor)."""
+    column = dwt_column(threshold_factor)
+    if column not in scores.columns:
+        raise KeyError(f"No DWT scores for threshold factor {threshold_factor:g}; compute them with dwt_factors")
+    with np.errstate(invalid='ignore'):
+        return np.abs(scores[column].to_numpy()) > threshold_factor
+
+
+def if_flags(scores: pd.DataFrame, contamination: float = IF_CONTAMINATION) -> np.ndarray:
+    """
+    Isolation Forest anomalies: the lowest `contamination` share of scores per
+    (sector, KPI) series. Multivariate scores (with an `if_attribution` column)
+    also need the KPI to carry IF_ATTRIBUTION_SHARE of the day's attribution.
+    """
+    with np.errstate(invalid='ignore'):
+        flags = scores['if_score'].to_numpy() < _group_percentile(scores, 'if_score', 100.0 * contamination)
+    if 'if_attribution' in scores.columns:
+        flags &= scores['if_attribution'].to_numpy() >= IF_ATTRIBUTION_SHARE
+    return flags
+
+
+def ensemble_flags(scores: pd.DataFrame, threshold_factor: float = ENSEMBLE_DWT_THRESHOLD,
+                   contamination: float = ENSEMBLE_CONTAMINATION) -> np.ndarray:
+    """Ensemble vote: flagged by both DWT-MLEAD and Isolation Forest."""
+    return dwt_flags(scores, threshold_factor) & if_flags(scores, contamination)
+
+
+def anomaly_frame(scores: pd.DataFrame, flags: np.ndarray, kpis=KPI_COLS) -> pd.DataFrame:
+    """
+    Flagged rows of `kpis` in the anomaly file layout (KPI, Site_ID, Sector_ID,
+    Date, then one column per KPI holding the value in the row's own KPI column),
+    ordered by KPI in `kpis` order, then sector and date.
+    """
+    flagged = scores[flags & scores['KPI'].isin(kpis).to_numpy()]
+    flagged = flagged.iloc[np.argsort(flagged['KPI'].map({k: i for i, k in enumerate(kpis)}).to_numpy(), kind='stable')]
+    frame = flagged[['KPI', 'Site_ID', 'Sector_ID', 'Date']].reset_index(drop=True)
+    for kpi in [k for k in kpis if k in set(flagged['KPI'])]:
+        frame[kpi] = np.where(flagged['KPI'].to_numpy() == kpi, flagged['Value'].to_numpy(), np.nan)
+    return frame
+
+
+def detection_frames(scores: pd.DataFrame, dwt_threshold: float = DWT_THRESHOLD,
+                     if_contamination: float = IF_CONTAMINATION,
+                     ensemble_threshold: float = ENSEMBLE_DWT_THRESHOLD,
+                     ensemble_contamination: float = ENSEMBLE_CONTAMINATION) -> dict:
+    """{"dwt": df_dwt, "if": df_if, "ensemble": df_ensemble} at the given thresholds."""
+    return {
+        "dwt": anomaly_frame(scores, dwt_flags(scores, dwt_threshold), DWT_KPIS),
+        "if": anomaly_frame(scores, if_flags(scores, if_contamination), IF_KPIS),
+        "ensemble": anomaly_frame(scores, ensemble_flags(scores, ensemble_threshold, ensemble_contamination), KPI_COLS),
+    }
+
+
+def run_detection(df_cleaned: pd.DataFrame, workers: int = None, chunk_size: int = 32,
+                  dwt_threshold: float = DWT_THRESHOLD, if_contamination: float = IF_CONTAMINATION,
+                  ensemble_threshold: float = ENSEMBLE_DWT_THRESHOLD,
+                  ensemble_contamination: float = ENSEMBLE_CONTAMINATION, if_mode: str = "univariate") -> dict:
+    """Scores every sector once and returns detection_frames at the given thresholds."""
+    scores = compute_scores(
+        df_cleaned, workers, chunk_size, dwt_factors=(dwt_threshold, ensemble_threshold), if_mode=if_mode
+    )
+    return detection_frames(scores, dwt_threshold, if_contamination, ensemble_threshold, ensemble_contamination)
+
+
+def save_scores(scores: pd.DataFrame, path: str = SCORES_PATH, source_md5: str = "",
+                ensemble_threshold: float = ENSEMBLE_DWT_THRESHOLD,
+                ensemble_contamination: float = ENSEMBLE_CONTAMINATION) -> str:
+    """
+    Writes `scores` plus its ensemble vote (`ensemble` column) as a compressed
+    columnar .npz in the layout of the CSV sidecars (see tools.py): one array
+    per column, ID columns as int32 codes + categories, scores as float32, and
+    the hash of the KPI CSV the scores were computed from. The ensemble settings are stored in
+    `__ensemble__` as [threshold factor, contamination].
+    """
+    scores = scores.assign(ensemble=ensemble_flags(scores, ensemble_threshold, ensemble_contamination))
+    arrays = {
+        "__columns__": np.array(scores.columns, dtype=str),
+        "__source_md5__": np.array(source_md5),
+        "__ensemble__": np.array([ensemble_threshold, ensemble_contamination], dtype=np.float64),
+    }
+    for col in scores.columns:
+        if col in CATEGORY_COLUMNS:
+            codes = scores[col].astype("category")
+            arrays[f"{col}.codes"] = codes.cat.codes.to_numpy(dtype=np.int32)
+            arrays[f"{col}.categories"] = np.array(codes.cat.categories, dtype=str)
+        elif col in ('if_score', 'if_attribution') or col.startswith('dwt_z_'):
+            arrays[col] = scores[col].to_numpy(dtype=np.float32)
+        else:
+            arrays[col] = scores[col].to_numpy()
+
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _file_md5(path: str) -> str:
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def build_online_state(df_cleaned: pd.DataFrame, scores: pd.DataFrame, model_keys: dict,
+                       model_cache_dir: str = MODEL_CACHE_DIR, window_days: int = ONLINE_WINDOW_DAYS) -> dict:
+    """
+    State for incremental scoring (score_new_rows) after a full run: every
+    sector's site and last date, the last `window_days` values of every
+    (Sector_ID, KPI) series (the DWT-MLEAD window) and the model cache keys of
+    the forests fitted by compute_scores together with their training scores
+    (for the IF cut-off).
+    """
+    df = df_cleaned.sort_values(by=['Sector_ID', 'Date'], kind='stable')
+    tail = df.groupby('Sector_ID', sort=False).tail(window_days)
+    windows = {
+        (sector_id, kpi): sector_df[kpi].to_numpy(dtype=np.float64)
+        for sector_id, sector_df in tail.groupby('Sector_ID', sort=False) for kpi in KPI_COLS
+    }
+    train_scores = {
+        (str(sector_id), str(kpi)): group['if_score'].dropna().to_numpy()
+        for (sector_id, kpi), group in scores.groupby(['Sector_ID', 'KPI'], sort=False, observed=True)
+    }
+    last_rows = df.groupby('Sector_ID', sort=False).tail(1)
+    return {
+        "window_days": window_days,
+        "last_date": dict(zip(last_rows['Sector_ID'], last_rows['Date'])),
+        "site": dict(zip(last_rows['Sector_ID'], last_rows['Site_ID'])),
+        "windows": windows,
+        "train_scores": train_scores,
+        "model_keys": model_keys,
+        "model_cache_dir": model_cache_dir,
+    }
+
+
+def save_online_state(state: dict, state_dir: str = ONLINE_STATE_DIR):
+    """
+    Persists `state` to state_dir/state.joblib. The forests themselves live in
+    the model cache; an incremental run only loads those of the sectors it touches.
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    path = os.path.join(state_dir, "state.joblib")
+    joblib.dump(state, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def load_online_state(state_dir: str = ONLINE_STATE_DIR) -> dict:
+    return joblib.load(os.path.join(state_dir, "state.joblib"))
+
+
+def score_new_rows(state: dict, new_rows: pd.DataFrame,
+                   threshold_factor: float = ENSEMBLE_DWT_THRESHOLD,
+                   contamination: float = ENSEMBLE_CONTAMINATION):
+    """
+    Ensemble-scores appended KPI rows against `state` (updated in place) and
+    returns `(df_ensemble_rows, fresh_rows, dirty_sectors)`.
+
+    Only rows newer than their sector's last date are used; only those
+    ("dirty") sectors are touched. For each of them and every KPI, DWT-MLEAD
+    runs over the stored window plus the new values (all dirty sectors in one
+    batched call) and the new days are flagged by their residual z-score; the
+    cached forest scores the new values against the cut-off from its training
+    scores. The cost grows with the number of new rows, not with the history.
+    Sectors without a forest (or whose forest is no longer in the model cache)
+    get one fitted on their window once they have MIN_SECTOR_DAYS values.
+    """
+    warnings.filterwarnings("ignore")
+    cache = model_cache(state["model_cache_dir"])
+    new_rows = new_rows.sort_values(by=['Sector_ID', 'Date'], kind='stable')
+    last_date = new_rows['Sector_ID'].map(state["last_date"])
+    fresh = new_rows[last_date.isna() | (new_rows['Date'] > last_date)]
+    sector_frames = [sector_df.reset_index(drop=True) for _, sector_df in fresh.groupby('Sector_ID', sort=True)]
+    dirty = [sector_df['Sector_ID'].iloc[0] for sector_df in sector_frames]
+
+    blocks = []
+    for kpi in KPI_COLS:
+        series = [
+            np.concatenate([state["windows"].get((sector_id, kpi), np.zeros(0)),
+                            sector_df[kpi].to_numpy(dtype=np.float64)])
+            for sector_id, sector_df in zip(dirty, sector_frames)
+        ]
+        lengths = np.array([len(values) for values in series], dtype=np.int64)
+        values = np.full((len(series), lengths.max(initial=0)), np.nan)
+        for i, v in enumerate(series):
+            values[i, :len(v)] = v
+        residual_z = dwt_mlead_batch(values, np.where(lengths >= MIN_SECTOR_DAYS, lengths, 0),
+                                     threshold_factor=threshold_factor)
+
+        for i, (sector_id, sector_df) in enumerate(zip(dirty, sector_frames)):
+            key = (sector_id, kpi)
+            new_values = sector_df[kpi].to_numpy(dtype=np.float64)
+            state["windows"][key] = series[i][-state["window_days"]:]
+
+            model = cache.get(sector_id, kpi, state["model_keys"][key]) if key in state["model_keys"] else None
+            if model is None and lengths[i] >= MIN_SECTOR_DAYS:
+                train, model, model_key = isolation_forest_scores(
+                    series[i], return_model=True, cache=cache, sector_id=sector_id, kpi=kpi
+                )
+                if model is not None:
+                    state["model_keys"][key] = model_key
+                    state["train_scores"][key] = train[~np.isnan(train)]
+            if model is None:
+                continue
+
+            if_score = np.full(len(new_values), np.nan)
+            valid = ~np.isnan(new_values)
+            if valid.any():
+                if_score[valid] = model.score_samples(new_values[valid].reshape(-1, 1))
+            block = sector_df[['Site_ID', 'Sector_ID', 'Date']].copy()
+            block.insert(0, 'KPI', kpi)
+            block['Value'] = new_values
+            block['dwt_z'] = residual_z[i, lengths[i] - len(new_values):lengths[i]]
+            block['if_score'] = if_score
+            block['if_cutoff'] = np.percentile(state["train_scores"][key], 100.0 * contamination)
+            blocks.append(block)
+
+    for sector_id, sector_df in zip(dirty, sector_frames):
+        state["last_date"][sector_id] = sector_df['Date'].iloc[-1]
+        state["site"][sector_id] = sector_df['Site_ID'].iloc[-1]
+
+    if not blocks:
+        return pd.DataFrame(), fresh, dirty
+    points = pd.concat(blocks, ignore_index=True)
+    with np.errstate(invalid='ignore'):
+        flags = (np.abs(points['dwt_z'].to_numpy()) > threshold_factor) & \
+                (points['if_score'].to_numpy() < points['if_cutoff'].to_numpy())
+    return anomaly_frame(points, flags, KPI_COLS), fresh, dirty
+
+
+def append_csv(path: str, rows: pd.DataFrame):
+    """Appends `rows` to a CSV in the file's column order (rewrites it if `rows` brings new columns)."""
+    if rows.empty:
+        return
+    if not os.path.exists(path):
+        rows.to_csv(path, index=False)
+        return
+    header = list(pd.read_csv(path, nrows=0).columns)
+    if set(rows.columns) <= set(header):
+        rows.reindex(columns=header).to_csv(path, mode='a', header=False, index=False)
+    else:
+        existing = pd.read_csv(path, float_precision="round_trip")
+        pd.concat([existing, rows], ignore_index=True).to_csv(path, index=False)
+
+
+def run_incremental(new_csv: str, kpi_csv: str = CLEANED_CSV_PATH, ensemble_csv: str = ENSEMBLE_CSV_PATH,
+                    state_dir: str = ONLINE_STATE_DIR,
+                    threshold_factor: float = ENSEMBLE_DWT_THRESHOLD,
+                    contamination: float = ENSEMBLE_CONTAMINATION):
+    """
+    Scores the rows of `new_csv` with score_new_rows, appends the new rows to
+    `kpi_csv` and their ensemble anomalies to `ensemble_csv`, and saves the
+    updated state.
+    """
+    new_rows = pd.read_csv(new_csv, parse_dates=["Date"], float_precision="round_trip")
+    new_rows[KPI_COLS] = new_rows[KPI_COLS].apply(pd.to_numeric, errors='coerce')
+    state = load_online_state(state_dir)
+
+    anomalies, fresh, dirty = score_new_rows(state, new_rows, threshold_factor, contamination)
+    append_csv(kpi_csv, fresh)
+    append_csv(ensemble_csv, anomalies)
+    save_online_state(state, state_dir)
+    return anomalies, fresh, dirty
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run DWT-MLEAD / Isolation Forest / ensemble anomaly detection.")
+    parser.add_argument("--input", default=CLEANED_CSV_PATH, help="cleaned KPI CSV (default: %(default)s)")
+    parser.add_argument("--raw", help="raw KPI CSV to clean first; the cleaned data is written to --input")
+    parser.add_argument("--chunksize", type=int,
+                        help="clean --raw in streamed chunks of this many rows (approximate percentiles; "
+                             "output sorted by Sector_ID, Date like the in-memory path)")
+    parser.add_argument("--independent-percentiles", action="store_true",
+                        help="take cleaning percentiles over all raw rows instead of the rows kept by earlier rules")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument("--output-dir", default="Data")
+    parser.add_argument("--dwt-threshold", type=float, default=DWT_THRESHOLD)
+    parser.add_argument("--if-contamination", type=float, default=IF_CONTAMINATION)
+    parser.add_argument("--ensemble-threshold", type=float, default=ENSEMBLE_DWT_THRESHOLD)
+    parser.add_argument("--ensemble-contamination", type=float, default=ENSEMBLE_CONTAMINATION)
+    parser.add_argument("--save-state", action="store_true",
+                        help="also persist windows and forest keys for later --append runs")
+    parser.add_argument("--no-model-cache", action="store_true",
+                        help="refit every forest instead of loading unchanged ones from the model cache")
+    parser.add_argument("--keep-old-models", action="store_true",
+                        help="keep cached forests this run did not use (by default they are deleted)")
+    parser.add_argument("--if-mode", choices=IF_MODES, default="univariate",
+                        help="Isolation Forest per (sector, KPI) series, per sector on the KPI vector, "
+                             "or one global forest (default: %(default)s)")
+    parser.add_argument("--append", metavar="NEW_CSV",
+                        help="incremental mode: score only the new rows in NEW_CSV and append them")
+    args = parser.parse_args()
+
+    if args.save_state and args.no_model_cache:
+        parser.error("--save-state needs the model cache")
+    if args.if_mode != "univariate" and (args.save_state or args.append):
+        parser.error("--save-state / --append only support --if-mode univariate")
+
+    t0 = time.perf_counter()
+    state_dir = os.path.join(args.output_dir, os.path.basename(ONLINE_STATE_DIR))
+    cache_dir = None if args.no_model_cache else os.path.join(args.output_dir, os.path.basename(MODEL_CACHE_DIR))
+    if args.append:
+        anomalies, fresh, dirty = run_incremental(
+            args.append, args.input, os.path.join(args.output_dir, os.path.basename(ENSEMBLE_CSV_PATH)),
+            state_dir, args.ensemble_threshold, args.ensemble_contamination,
+        )
+        print(
+            f"{len(fresh)} new rows in {len(dirty)} sectors -> {args.input}; "
+            f"{len(anomalies)} ensemble anomalies appended ({time.perf_counter() - t0:.1f}s)"
+        )
+        return
+
+    if args.raw:
+        sequential = not args.independent_percentiles
+        if args.chunksize:
+            report = clean_kpi_csv(args.raw, args.input, define_kpi_bounds(), args.chunksize, sequential)
+            df_cleaned = pd.read_csv(args.input, parse_dates=["Date"], float_precision="round_trip")
+        else:
+            df_cleaned, report = clean_kpi_frame(load_raw_kpi_data(args.raw), define_kpi_bounds(), sequential)
+            df_cleaned.to_csv(args.input, index=False)
+        print(report.to_string(index=False))
+        print(f"cleaning: {len(df_cleaned)} rows kept, {int(report['removed'].sum())} removed -> {args.input}")
+    else:
+        df_cleaned = pd.read_csv(args.input, parse_dates=["Date"], float_precision="round_trip")
+
+    model_keys = {}
+    scores = compute_scores(
+        df_cleaned, args.workers, dwt_factors=(args.dwt_threshold, args.ensemble_threshold),
+        model_cache_dir=cache_dir, model_keys=model_keys, if_mode=args.if_mode,
+    )
+    if cache_dir is not None and not args.keep_old_models:
+        removed, freed = model_cache(cache_dir).prune(model_keys)
+        print(f"model cache: {len(model_keys)} forests in use, {removed} unused removed ({freed / 1e6:.1f} MB)")
+    frames = detection_frames(
+        scores, args.dwt_threshold, args.if_contamination, args.ensemble_threshold, args.ensemble_contamination
+    )
+    os.makedirs(args.output_dir, exist_ok=True)
+    scores_path = save_scores(
+        scores, os.path.join(args.output_dir, os.path.basename(SCORES_PATH)), _file_md5(args.input),
+        args.ensemble_threshold, args.ensemble_contamination,
+    )
+    print(f"scores: {len(scores)} points -> {scores_path}")
+    for method, path in [("dwt", DWT_CSV_PATH), ("if", IF_CSV_PATH), ("ensemble", ENSEMBLE_CSV_PATH)]:
+        path = os.path.join(args.output_dir, os.path.basename(path))
+        frames[method].to_csv(path, index=False)
+        print(f"{method}: {len(frames[method])} anomalies -> {path}")
+    if args.save_state:
+        save_online_state(build_online_state(df_cleaned, scores, model_keys, cache_dir), state_dir)
+        print(f"online state -> {state_dir}")
+    print(f"{df_cleaned['Sector_ID'].nunique()} sectors in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
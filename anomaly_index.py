@@ -0,0 +1,216 @@
+"""
+In-memory index over the ensemble anomaly file (Data/df_ensemble.csv).
+
+Every anomaly row is reduced to integer codes and stored once, sorted by
+(KPI, day, sector):
+
+    kpi code  ->  rows [kpi_offsets[k], kpi_offsets[k + 1])
+    within a KPI, key = day * n_sectors + sector code is sorted
+
+Sectors are coded in (Site_ID, Sector_ID) order, so a site is a contiguous
+range of sector codes. Any (KPI, day range, site or sector) filter is then a
+handful of np.searchsorted calls per day instead of boolean masks over the
+whole frame, and per-day anomaly counts fall out of the slice bounds directly.
+
+The same rows are also kept as packed bitsets over the day axis, one per
+(KPI, sector): bits[k, s] has bit d set when KPI k was anomalous in sector s on
+day d (day d is bit d % 64 of word d // 64). Co-occurrence between KPIs at any scope is then a bitwise AND plus a
+popcount over a slice of sectors, for all KPI pairs at once, and "y within N
+days after x" is the same with y's bitsets shifted by 1..N days.
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from kpi_cube import day_slice
+
+# Number of set bits in every byte value
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def shift_days(words: np.ndarray, lag: int) -> np.ndarray:
+    """Day bitsets moved `lag` (1..63) days earlier: bit d of the result is bit d + lag of `words`."""
+    shifted = words >> np.uint64(lag)
+    shifted[..., :-1] |= words[..., 1:] << np.uint64(64 - lag)
+    return shifted
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Per-element set-bit counts of a uint64 array (np.bitwise_count on NumPy >= 2)."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    return _POPCOUNT[words.view(np.uint8)].reshape(*words.shape, 8).sum(axis=-1)
+
+
+class AnomalyIndex:
+
+    def __init__(self, df: pd.DataFrame):
+        """`df` is the typed anomaly frame: KPI, Site_ID, Sector_ID, Date and one value column per KPI."""
+        df = df.dropna(subset=["KPI", "Date", "Sector_ID"])
+
+        sector_site = (
+            df[["Sector_ID", "Site_ID"]].astype(str).drop_duplicates("Sector_ID")
+            .sort_values(["Site_ID", "Sector_ID"])
+        )
+        self.sectors = sector_site["Sector_ID"].tolist()
+        self.sector_pos = {s: i for i, s in enumerate(self.sectors)}
+        sites, site_starts, site_counts = np.unique(
+            sector_site["Site_ID"].to_numpy(), return_index=True, return_counts=True
+        )
+        self.site_bounds = {str(s): (int(lo), int(lo + n)) for s, lo, n in zip(sites, site_starts, site_counts)}
+        self.n_sectors = len(self.sectors)
+
+        self.kpis = sorted(df["KPI"].astype(str).unique())
+        self.kpi_pos = {k: i for i, k in enumerate(self.kpis)}
+
+        days = df["Date"].values.astype("datetime64[D]")
+        self.start = pd.Timestamp(days.min()) if len(days) else pd.NaT
+        self.n_days = int((days.max() - days.min()).astype(int)) + 1 if len(days) else 0
+
+        kpi_code = df["KPI"].astype(str).map(self.kpi_pos).to_numpy()
+        sector_code = df["Sector_ID"].astype(str).map(self.sector_pos).to_numpy()
+        day = (days - days.min()).astype(np.int64) if len(days) else np.zeros(0, dtype=np.int64)
+
+        # The anomalous value of each row lives in the column named by its KPI
+        value = np.full(len(df), np.nan)
+        for kpi in self.kpis:
+            rows = kpi_code == self.kpi_pos[kpi]
+            if kpi in df.columns:
+                value[rows] = df.loc[rows, kpi].to_numpy(dtype=np.float64)
+
+        order = np.lexsort((sector_code, day, kpi_code))
+        self.row = order
+        self.kpi_code = kpi_code[order]
+        self.day = day[order]
+        self.sector_code = sector_code[order]
+        self.value = value[order]
+        self.key = self.day * max(self.n_sectors, 1) + self.sector_code
+        self.kpi_offsets = np.searchsorted(self.kpi_code, np.arange(len(self.kpis) + 1))
+
+        self.bits = self._pack((len(self.kpis), self.n_sectors), self.kpi_code, self.sector_code, self.day)
+
+    def _pack(self, shape: tuple, *positions) -> np.ndarray:
+        """uint64 day bitsets of shape `shape + (words,)` with the given (..., day) positions set."""
+        flags = np.zeros(shape + (-(-self.n_days // 64) * 64,), dtype=bool)
+        flags[positions] = True
+        return np.ascontiguousarray(np.packbits(flags, axis=-1, bitorder="little")).view("<u8")
+
+    def date(self, day: int) -> pd.Timestamp:
+        return self.start + pd.Timedelta(days=int(day))
+
+    def sector_range(self, site_id: Optional[str] = None, sector_id: Optional[str] = None):
+        """Half-open sector-code range matching the site and/or sector filter (empty if none match)."""
+        lo, hi = 0, self.n_sectors
+        if site_id:
+            lo, hi = self.site_bounds.get(site_id, (0, 0))
+        if sector_id:
+            code = self.sector_pos.get(sector_id)
+            if code is None or not lo <= code < hi:
+                return 0, 0
+            lo, hi = code, code + 1
+        return lo, hi
+
+    def day_range(self, start_date=None, end_date=None):
+        """Half-open day range for an inclusive date window; None means unbounded."""
+        if start_date is None and end_date is None:
+            return 0, self.n_days
+        return day_slice(
+            self.start, self.n_days,
+            self.start if start_date is None else start_date,
+            self.date(self.n_days - 1) if end_date is None else end_date,
+        )
+
+    def slices(self, kpi: str, days, sector_lo: int, sector_hi: int):
+        """
+        Row bounds `(lo, hi)` arrays, one pair per day in `days`, of the
+        anomalies of `kpi` in sector codes [sector_lo, sector_hi).
+        """
+        days = np.asarray(days, dtype=np.int64)
+        k = self.kpi_pos.get(kpi)
+        if k is None or sector_hi <= sector_lo:
+            return np.zeros(len(days), dtype=np.int64), np.zeros(len(days), dtype=np.int64)
+        base = self.kpi_offsets[k]
+        keys = self.key[base:self.kpi_offsets[k + 1]]
+        lo = base + np.searchsorted(keys, days * self.n_sectors + sector_lo)
+        hi = base + np.searchsorted(keys, days * self.n_sectors + sector_hi)
+        return lo, hi
+
+    def daily_counts(self, kpi: str, days, sector_lo: int, sector_hi: int) -> np.ndarray:
+        lo, hi = self.slices(kpi, days, sector_lo, sector_hi)
+        return hi - lo
+
+    def values(self, kpi: str, days, sector_lo: int, sector_hi: int) -> np.ndarray:
+        """Anomalous values of `kpi` on `days` within the sector range, in source file order."""
+        lo, hi = self.slices(kpi, days, sector_lo, sector_hi)
+        counts = hi - lo
+        if not counts.sum():
+            return self.value[:0]
+        # Concatenated aranges of every [lo, hi) without a Python loop
+        starts = np.repeat(lo - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+        positions = starts + np.arange(counts.sum())
+        return self.value[positions[np.argsort(self.row[positions], kind="stable")]]
+
+    def day_mask(self, day_lo: int, day_hi: int) -> np.ndarray:
+        """Packed bit mask of the days in [day_lo, day_hi)."""
+        return self._pack((), np.arange(max(day_lo, 0), min(day_hi, self.n_days)))
+
+    def cooccurrence(self, sector_lo: int, sector_hi: int, day_lo: int, day_hi: int,
+                     same_sector: bool = False) -> np.ndarray:
+        """
+        KPI x KPI co-occurrence counts within sector codes [sector_lo, sector_hi)
+        and days [day_lo, day_hi), rows/columns in `self.kpis` order.
+
+        By default counts[x, y] is the number of `y` anomalies on days on which `x`
+        had any anomaly somewhere in the scope (what kpi_anomalies reports). With
+        `same_sector=True` both must hit the same sector on the same day. The
+        diagonal is the number of anomalies of each KPI in the scope.
+        """
+        block = self.bits[:, sector_lo:max(sector_lo, sector_hi)] & self.day_mask(day_lo, day_hi)
+        counts = np.zeros((len(self.kpis), len(self.kpis)), dtype=np.int64)
+        if same_sector:
+            for x in range(len(self.kpis)):
+                counts[x] = popcount(block & block[x]).sum(axis=(1, 2), dtype=np.int64)
+        else:
+            any_day = np.bitwise_or.reduce(block, axis=1)
+            for x in range(len(self.kpis)):
+                counts[x] = popcount(block & any_day[x]).sum(axis=(1, 2), dtype=np.int64)
+        return counts
+
+    def lagged_cooccurrence(self, sector_lo: int, sector_hi: int, day_lo: int, day_hi: int,
+                            max_lag: int = 3, same_sector: bool = True):
+        """
+        Counts of "x anomaly followed by a y anomaly within 1..max_lag days" for all
+        KPI pairs within sector codes [sector_lo, sector_hi) and days [day_lo, day_hi).
+
+        With `same_sector=True` an event is an anomalous sector-day and y must hit the
+        same sector; otherwise an event is a day with any anomaly in the scope.
+        Returns `(followed, events, lift)`: followed[x, y] events of x followed by y,
+        events[x] events of x, and lift[x, y] = P(y follows | x) / P(y follows), the
+        base rate being taken over every sector-day (or day) of the scope. NaN where
+        x has no events or y never follows anything.
+        """
+        if not 1 <= max_lag < 64:
+            raise ValueError("max_lag must be between 1 and 63 days")
+        mask = self.day_mask(day_lo, day_hi)
+        block = self.bits[:, sector_lo:max(sector_lo, sector_hi)] & mask
+        if not same_sector:
+            block = np.bitwise_or.reduce(block, axis=1, keepdims=True)
+
+        # Bit d of ahead[y] is set when y is anomalous on any of days d+1..d+max_lag
+        ahead = np.zeros_like(block)
+        for lag in range(1, max_lag + 1):
+            ahead |= shift_days(block, lag)
+        ahead &= mask
+
+        events = popcount(block).sum(axis=(1, 2), dtype=np.int64)
+        followed = np.zeros((len(self.kpis), len(self.kpis)), dtype=np.int64)
+        for x in range(len(self.kpis)):
+            followed[x] = popcount(ahead & block[x]).sum(axis=(1, 2), dtype=np.int64)
+
+        units = block.shape[1] * max(min(day_hi, self.n_days) - max(day_lo, 0), 0)
+        base_rate = popcount(ahead).sum(axis=(1, 2), dtype=np.int64) / max(units, 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lift = (followed / events[:, None]) / base_rate[None, :]
+        lift[~np.isfinite(lift)] = np.nan
+        return followed, events, lift
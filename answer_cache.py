@@ -0,0 +1,188 @@
+"""
+Cache of final agent answers for repeated questions.
+
+Operators ask the same few questions in slightly different words. A question
+is reduced to
+
+    - its entities (KPIs, site / sector, highest / lowest, resolved date
+      window, top-k; see intent_router.extract_entities) plus the subject
+      words that change what is asked (site vs sector, day, anomalies, ...),
+      negations and any number or year, which must all match exactly, and
+    - its remaining content words, compared as a set: only equal sets are a
+      hit (so "dropped" never matches "rose", nor "low" "high"). With a local
+      embedding model, the closest cached wording with cosine similarity of at
+      least `embedding_similarity` is a hit as well.
+
+Entries expire after `ttl` seconds and are stored per data version, so a
+changed CSV never serves an old answer. Only self-contained questions are
+cached (no chat history, or no words that refer back to it).
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+from intent_router import extract_entities, normalize_question
+
+STOP_WORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "has", "have", "had", "do", "does", "did",
+    "what", "which", "who", "whose", "please", "show", "me", "tell", "give", "find", "list", "can", "you",
+    "i", "we", "our", "my", "in", "on", "at", "of", "for", "to", "from", "by", "with", "during", "over",
+    "and", "or", "there", "any", "value", "values", "kpi", "data", "network",
+}
+
+# Words that change what is asked even when the entities are the same
+SUBJECT_WORDS = {
+    "site", "sites", "sector", "sectors", "day", "days", "date", "when", "anomaly", "anomalies", "average",
+    "mean", "total", "count", "many", "leaderboard", "rank", "ranking", "top", "bottom", "trend", "why",
+    "how", "compare", "impact", "cause", "precursor", "precursors", "cooccurrence", "describe", "summary",
+}
+
+# Negations flip the question: "why is SINR low" vs "why is SINR not low" ("isn't" -> "isn t")
+NEGATION_WORDS = {"not", "no", "never", "without", "except", "excluding", "none", "nor", "neither", "nothing",
+                  "isn", "wasn", "aren", "weren", "don", "doesn", "didn", "hasn", "haven", "hadn", "cannot"}
+
+# Words that make a question depend on the conversation so far
+CONTEXT_WORDS = {"it", "its", "that", "those", "these", "them", "they", "same", "also", "again", "instead",
+                 "previous", "above", "else", "more"}
+
+
+def is_self_contained(question: str, chat_history=None) -> bool:
+    """True if the question can be answered without the chat history."""
+    if not chat_history:
+        return True
+    words = set(normalize_question(question).split())
+    return not (words & CONTEXT_WORDS) and not re.match(r"^(and|but|what about|how about)\b", normalize_question(question))
+
+
+def local_embedder(model_name: Optional[str]) -> Optional[Callable]:
+    """Unit-norm sentence embeddings from a local sentence-transformers model, or None if unavailable."""
+    if not model_name:
+        return None
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        return None
+    model = SentenceTransformer(model_name)
+    return lambda text: np.asarray(model.encode(text, normalize_embeddings=True), dtype=np.float32)
+
+
+class AnswerCache:
+
+    def __init__(self, ttl: float = 3600.0, max_entries: int = 512,
+                 embedder: Optional[Callable] = None, embedding_similarity: float = 0.92,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embedder = embedder
+        self.embedding_similarity = embedding_similarity
+        self.clock = clock
+        self._lock = threading.Lock()
+        # (data version, signature) -> {content words: (answer, embedding, expires at)}
+        self._buckets = OrderedDict()
+        self._size = 0
+        self.stats = {"hits": 0, "similar_hits": 0, "misses": 0, "expired": 0, "evictions": 0, "stores": 0}
+
+    def key(self, question: str):
+        """`(signature, content words)` of a question, or None if its entities cannot be read."""
+        entities = extract_entities(question)
+        if entities is None:
+            return None
+        words = [w for w in entities.text.split() if w not in STOP_WORDS]
+        signature = (
+            tuple(entities.kpis), entities.site_id, entities.sector_id, entities.extreme,
+            entities.start_date, entities.end_date, entities.top_k,
+            frozenset(w for w in words if w in SUBJECT_WORDS or w in NEGATION_WORDS or any(c.isdigit() for c in w)),
+        )
+        return signature, frozenset(words)
+
+    def _embed(self, question: str):
+        return self.embedder(question) if self.embedder is not None else None
+
+    def get(self, question: str, version) -> Optional[str]:
+        """The cached answer to `question` (or a close rewording of it) for data `version`, or None."""
+        key = self.key(question)
+        if key is None:
+            return None
+        signature, words = key
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get((version, signature))
+            if bucket is not None:
+                for cached_words in [w for w, (_, _, expires) in bucket.items() if expires <= now]:
+                    del bucket[cached_words]
+                    self._size -= 1
+                    self.stats["expired"] += 1
+                if not bucket:
+                    del self._buckets[(version, signature)]
+            if not bucket:
+                self.stats["misses"] += 1
+                return None
+            self._buckets.move_to_end((version, signature))
+            if words in bucket:
+                self.stats["hits"] += 1
+                return bucket[words][0]
+            # Word overlap ignores order and meaning, so only an embedding model may match rewordings
+            candidates = [(answer, e) for answer, e, _ in bucket.values() if e is not None]
+            if self.embedder is None or not candidates:
+                self.stats["misses"] += 1
+                return None
+
+        best, best_score = None, 0.0
+        embedding = self._embed(question)
+        for answer, cached_embedding in candidates:
+            score = float(np.dot(embedding, cached_embedding))
+            if score >= self.embedding_similarity and score > best_score:
+                best, best_score = answer, score
+        with self._lock:
+            self.stats["similar_hits" if best is not None else "misses"] += 1
+            if best is not None:
+                self.stats["hits"] += 1
+        return best
+
+    def put(self, question: str, version, answer: str):
+        key = self.key(question)
+        if key is None or not answer:
+            return
+        signature, words = key
+        embedding = self._embed(question)
+        with self._lock:
+            # Entries of older data versions can never hit again
+            for stale in [k for k in self._buckets if k[0] != version]:
+                self._size -= len(self._buckets.pop(stale))
+            bucket = self._buckets.setdefault((version, signature), OrderedDict())
+            self._buckets.move_to_end((version, signature))
+            if words not in bucket:
+                self._size += 1
+            bucket[words] = (answer, embedding, self.clock() + self.ttl)
+            self.stats["stores"] += 1
+            while self._size > self.max_entries:
+                oldest_key, oldest = next(iter(self._buckets.items()))
+                if oldest:
+                    oldest.popitem(last=False)
+                    self._size -= 1
+                    self.stats["evictions"] += 1
+                if not oldest:
+                    del self._buckets[oldest_key]
+
+    def info(self) -> dict:
+        with self._lock:
+            return dict(self.stats, entries=self._size, max_entries=self.max_entries, ttl=self.ttl,
+                        embeddings=self.embedder is not None)
+
+
+def answer_cache_from_env() -> AnswerCache:
+    """
+    AnswerCache configured from ANSWER_CACHE_TTL (seconds, default 3600),
+    ANSWER_CACHE_SIZE (default 512) and ANSWER_CACHE_EMBEDDINGS (name of a
+    local sentence-transformers model; word overlap only if unset).
+    """
+    return AnswerCache(
+        ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+        max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+        embedder=local_embedder(os.getenv("ANSWER_CACHE_EMBEDDINGS")),
+    )
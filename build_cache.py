@@ -0,0 +1,46 @@
+"""
+Converts the KPI and anomaly CSVs into typed columnar sidecars (.npz).
+
+Run after every ingest / anomaly-detection run:
+
+    python build_cache.py                 # default data files
+    python build_cache.py path/to/a.csv   # specific files
+    python build_cache.py --cube          # also build the memory-mapped KPI cube
+
+tools.py reads the sidecar instead of the CSV whenever the sidecar is at least
+as new as its source.
+"""
+import argparse
+import os
+import time
+
+from kpi_cube import build_cube
+from tools import KPI_CSV_PATH, ANOMALY_CSV_PATH, write_sidecar, read_csv_columns
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build columnar .npz sidecars for the KPI CSV files.")
+    parser.add_argument("csv", nargs="*", default=[KPI_CSV_PATH, ANOMALY_CSV_PATH],
+                        help="CSV files to convert (default: KPI and ensemble anomaly data)")
+    parser.add_argument("--cube", action="store_true",
+                        help="also build the sector x day x KPI cube for the KPI data (see kpi_cube.py)")
+    args = parser.parse_args()
+
+    for csv_path in args.csv:
+        t0 = time.perf_counter()
+        npz_path = write_sidecar(csv_path)
+        print(
+            f"{csv_path} -> {npz_path} "
+            f"({os.path.getsize(csv_path) / 1e6:.1f} MB -> {os.path.getsize(npz_path) / 1e6:.1f} MB, "
+            f"{time.perf_counter() - t0:.2f}s)"
+        )
+
+    if args.cube:
+        t0 = time.perf_counter()
+        df, _ = read_csv_columns(KPI_CSV_PATH)
+        npy_path = build_cube(KPI_CSV_PATH, df)
+        print(f"{KPI_CSV_PATH} -> {npy_path} ({os.path.getsize(npy_path) / 1e6:.1f} MB, {time.perf_counter() - t0:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Precomputes compare_kpi_impact statistics for every ordered KPI pair.
+
+For each scope (all sites pooled, every Site_ID and every Sector_ID) and each
+of the 90 ordered pairs of the 10 KPIs this stores the directional-increase
+ratio and the best Granger ssr F-test p-value over the full date range:
+
+    python granger_batch.py               # all CPU cores
+    python granger_batch.py --workers 4
+
+Every scope's rows are stacked once into a NaN-padded (scopes, rows, KPIs)
+array ordered by date, and each pair is then evaluated for all scopes of a
+kind with one call to the batched Granger engine in tools.py. Pairs are
+spread over a process pool.
+
+The results go to Data/granger_results.npz as dense [scope, kpi_x, kpi_y]
+arrays together with the hash of the KPI data they were computed from.
+compare_kpi_impact answers from this file whenever no custom date range is
+given and the hash still matches; otherwise it computes live.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tools import GRANGER_RESULTS_PATH, KEY_COLUMNS, kpi_store, pair_impact_stats, stack_scopes
+
+MAXLAG = 2
+
+
+_stacks = None
+
+
+def _init_worker(stacks):
+    global _stacks
+    _stacks = stacks
+
+
+def _run_pair(pair):
+    x, y = pair
+    return [pair_impact_stats(values, lengths, x, y, MAXLAG) for values, lengths in _stacks]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute Granger / directional statistics for all KPI pairs.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument("--output", default=GRANGER_RESULTS_PATH)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    df = kpi_store.get()
+    kpis = [c for c in df.columns if c not in KEY_COLUMNS]
+
+    scopes, stacks = [], []
+    for column in [None, "Site_ID", "Sector_ID"]:
+        names, values, lengths = stack_scopes(df, kpis, column)
+        scopes += names
+        stacks.append((values, lengths))
+
+    shape = (len(scopes), len(kpis), len(kpis))
+    rising_count = np.zeros(shape, dtype=np.int64)
+    conditional_prob = np.full(shape, np.nan)
+    p_value = np.full(shape, np.nan)
+
+    pairs = [(x, y) for x in range(len(kpis)) for y in range(len(kpis)) if x != y]
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(stacks,)) as pool:
+        for (x, y), per_kind in zip(pairs, pool.map(_run_pair, pairs)):
+            rising = np.concatenate([r for r, _, _ in per_kind])
+            rising_both = np.concatenate([b for _, b, _ in per_kind])
+            rising_count[:, x, y] = rising
+            conditional_prob[:, x, y] = np.where(rising > 0, rising_both / np.maximum(rising, 1), 0.0)
+            p_value[:, x, y] = np.concatenate([p for _, _, p in per_kind])
+
+    tmp_path = args.output + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        source_md5=np.array(kpi_store.version),
+        scopes=np.array(scopes, dtype=str),
+        kpis=np.array(kpis, dtype=str),
+        rising_count=rising_count,
+        conditional_prob=conditional_prob,
+        p_value=p_value,
+    )
+    os.replace(tmp_path, args.output)
+    print(
+        f"{len(scopes)} scopes x {len(pairs)} KPI pairs -> {args.output} "
+        f"({time.perf_counter() - t0:.1f}s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Deterministic fast path for well-formed KPI questions.
+
+Questions such as
+
+    "Which site had the highest SINR last week?"
+    "On which day did SITE_005 have the lowest DL throughput in February?"
+    "Top 3 sites by packet loss and RTT between 2024-02-01 and 2024-02-14"
+    "Show the 5 most severe RTT anomalies at SITE_012"
+
+name everything a return_direct tool needs. route_question parses the KPI
+names, site / sector IDs, highest / lowest and the date window against the
+known vocabulary (KPI aliases, the IDs and date range of the KPI data) and
+returns the tool call to make, or None as soon as anything is missing,
+ambiguous, not understood (any word left over that is not in FILLER_WORDS) or
+asks for reasoning ("why", "compare", ...) so the question goes to the LLM
+agent as before.
+"""
+import re
+from datetime import timedelta
+from typing import NamedTuple, Optional
+
+import pandas as pd
+
+from tools import kpi_vocabulary
+
+KPI_ALIASES = {
+    "RSRP": ["rsrp", "reference signal received power", "signal strength"],
+    "SINR": ["sinr", "signal to interference plus noise ratio", "signal to interference"],
+    "DL_Throughput": ["dl throughput", "downlink throughput", "download throughput", "download speed"],
+    "UL_Throughput": ["ul throughput", "uplink throughput", "upload throughput", "upload speed"],
+    "RTT": ["rtt", "round trip time", "latency"],
+    "CPU_Utilization": ["cpu utilization", "cpu utilisation", "cpu usage", "cpu load", "cpu"],
+    "Call_Drop_Rate": ["call drop rate", "call drops", "dropped calls", "drop rate"],
+    "Active_Users": ["active users", "number of users", "user count"],
+    "Handover_Success_Rate": ["handover success rate", "handover success", "handover"],
+    "Packet_Loss": ["packet loss"],
+}
+
+HIGH_WORDS = ["highest", "maximum", "max", "peak", "most", "largest", "biggest", "greatest"]
+LOW_WORDS = ["lowest", "minimum", "min", "least", "smallest"]
+
+# Anything that needs reasoning, other tools or a date phrase we do not parse
+FALLBACK_WORDS = [
+    "why", "how", "explain", "compare", "comparison", "versus", "vs", "impact", "affect", "affects", "cause",
+    "causes", "caused", "correlate", "correlation", "relationship", "predict", "forecast", "trend",
+    "recommend", "should", "could", "would", "summarize", "summary", "search", "news", "precursor",
+    "precursors", "co occur", "cooccur", "cooccurrence", "together", "average of", "each", "every",
+    "yesterday", "today", "tomorrow", "hour", "hours", "quarter", "year", "weekend", "morning", "evening",
+    "not", "except", "without", "excluding",
+]
+
+# Words a routable question may contain besides KPIs, IDs, dates and counts; any other word sends it to the LLM
+FILLER_WORDS = set(HIGH_WORDS + LOW_WORDS) | {
+    "which", "what", "who", "where", "when", "is", "are", "was", "were", "be", "been", "has", "have", "had",
+    "do", "does", "did", "show", "me", "give", "list", "tell", "find", "get", "display", "please", "can", "you",
+    "the", "a", "an", "in", "on", "at", "of", "for", "by", "to", "from", "with", "between", "and",
+    "during", "over", "across", "within", "among", "all", "per",
+    "site", "sites", "sector", "sectors", "day", "date", "kpi", "kpis", "value", "values", "level", "levels",
+    "average", "avg", "mean", "top", "bottom", "first", "severe", "worst", "strongest", "anomaly", "anomalies",
+    "anomalous", "leaderboard", "ranking", "rank", "ranked", "recorded", "observed", "seen", "measured",
+}
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august", "september",
+          "october", "november", "december"]
+
+_ALIAS_PATTERNS = sorted(
+    ((alias, kpi) for kpi, aliases in KPI_ALIASES.items() for alias in aliases + [kpi.lower().replace("_", " ")]),
+    key=lambda item: -len(item[0]),
+)
+_SECTOR_RE = re.compile(r"\bsite[\s-]*0*(\d{1,4})[\s-]*sector[\s-]*([a-z])\b")
+_SITE_RE = re.compile(r"\bsite[\s-]*0*(\d{1,4})\b")
+_ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_DOTTED_DATE_RE = re.compile(r"\b(\d{1,2})\.(\d{1,2})\.(\d{2}|\d{4})\b")
+_DATE = r"(?:\d{4}-\d{1,2}-\d{1,2}|\d{1,2}\.\d{1,2}\.(?:\d{4}|\d{2}))"
+# "between D and D", "from D to D", "D until D": two dates joined by "and" alone are a list, not a range
+_DATE_RANGE_RE = re.compile(
+    rf"\b(?:(?:between|from)\s+{_DATE}\s+(?:and|to|until|till|through)|{_DATE}\s+(?:to|until|till|through))\s+{_DATE}\b"
+)
+# Open-ended windows are only understood for one explicit date ("since 2024-02-10")
+_OPEN_DATE_RE = re.compile(rf"\b(since|from|until|till)\s+(?={_DATE}\b)")
+_LAST_DAYS_RE = re.compile(r"\b(?:last|past|previous)\s+(\d{1,3})\s+days?\b")
+_LAST_PERIOD_RE = re.compile(r"\b(?:last|past|previous)\s+(week|month)\b")
+_MONTH_RE = re.compile(
+    rf"\b(?:(?:in|during|for|of)\s+({'|'.join(MONTHS)})(?:\s+(\d{{4}}))?|({'|'.join(MONTHS)})\s+(\d{{4}}))\b"
+)
+_YEAR_RE = re.compile(r"\b\d{4}\b")
+_TOP_N_RE = re.compile(r"\b(?:top|bottom|first)\s+(\d{1,3})\b|\b(\d{1,3})\s+(?:most|highest|lowest|worst|biggest|largest|top)\b")
+
+
+class Intent(NamedTuple):
+    tool: str
+    args: dict
+
+
+class Entities(NamedTuple):
+    """Everything route_question extracted from one question."""
+    kpis: list
+    site_id: Optional[str]
+    sector_id: Optional[str]
+    extreme: Optional[str]
+    start_date: Optional[str]
+    end_date: Optional[str]
+    top_k: Optional[int]
+    text: str
+    # Words that are neither KPIs, IDs, dates, counts nor FILLER_WORDS
+    unparsed: tuple
+
+
+def normalize_question(question: str) -> str:
+    """Lower case, `_`/`-`/punctuation between words folded to single spaces (dates kept intact)."""
+    text = question.lower().replace("_", " ")
+    text = re.sub(r"(?<=[a-z])-(?=[a-z])", " ", text)
+    text = re.sub(r"[^\w\s.\-]", " ", text)
+    text = re.sub(r"\.(?!\d)", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _has_word(text: str, words) -> bool:
+    return any(re.search(rf"\b{re.escape(w)}\b", text) for w in words)
+
+
+def _extract_kpis(text: str):
+    """KPI columns named in `text` in order of appearance, and the text with the matches removed."""
+    found = []
+    for alias, kpi in _ALIAS_PATTERNS:
+        pattern = re.compile(rf"\b{re.escape(alias)}\b")
+        for match in pattern.finditer(text):
+            found.append((match.start(), kpi))
+        text = pattern.sub(" ", text)
+    kpis = []
+    for _, kpi in sorted(found):
+        if kpi not in kpis:
+            kpis.append(kpi)
+    return kpis, text
+
+
+def _remove_dates(text: str) -> str:
+    for pattern in [_DATE_RANGE_RE, _OPEN_DATE_RE, _ISO_DATE_RE, _DOTTED_DATE_RE, _LAST_DAYS_RE, _LAST_PERIOD_RE, _MONTH_RE]:
+        text = pattern.sub(" ", text)
+    return text
+
+
+def _extract_dates(text: str, first: pd.Timestamp, last: pd.Timestamp):
+    """
+    `(start, end, ok)` for the date window in `text`: explicit dates
+    (YYYY-MM-DD or DD.MM.YY), "since / until <date>", "between <date> and
+    <date>", "last N days", "last week/month" (counted back from the last data
+    day) or a month name. `ok` is False when the phrases conflict, a date does
+    not parse or two dates are not written as a range.
+    """
+    dates = []
+    for year, month, day in _ISO_DATE_RE.findall(text):
+        dates.append((int(year), int(month), int(day)))
+    for day, month, year in _DOTTED_DATE_RE.findall(text):
+        dates.append((int(year) + (2000 if len(year) == 2 else 0), int(month), int(day)))
+    try:
+        dates = [pd.Timestamp(year=y, month=m, day=d) for y, m, d in dates]
+    except ValueError:
+        return None, None, False
+
+    windows = []
+    if len(dates) == 1:
+        date = dates[0]
+        qualifier = _OPEN_DATE_RE.search(text)
+        if qualifier is None:
+            windows.append((date, date))
+        elif qualifier.group(1) in ("since", "from"):
+            windows.append((date, None))
+        else:
+            windows.append((first, date))
+    elif len(dates) == 2:
+        if not _DATE_RANGE_RE.search(text):
+            return None, None, False
+        windows.append((min(dates), max(dates)))
+    elif dates:
+        return None, None, False
+
+    for days in _LAST_DAYS_RE.findall(text):
+        windows.append((last - timedelta(days=int(days)), last))
+    for period in _LAST_PERIOD_RE.findall(text):
+        windows.append((last - timedelta(days=7 if period == "week" else 30), last))
+    for month, year, month_alone, year_alone in _MONTH_RE.findall(text):
+        month_start = pd.Timestamp(year=int(year or year_alone or last.year),
+                                   month=MONTHS.index(month or month_alone) + 1, day=1)
+        windows.append((month_start, month_start + pd.offsets.MonthEnd(0)))
+
+    leftover = _remove_dates(text)
+    # "this week", "over 3 days", "the month before", ...
+    if len(windows) > 1 or re.search(r"\b(days|weeks?|months?)\b", leftover):
+        return None, None, False
+    if not windows:
+        return None, None, True
+    start, end = windows[0]
+    fmt = lambda d: None if d is None else d.strftime("%Y-%m-%d")
+    return fmt(start), fmt(end), True
+
+
+def extract_entities(question: str) -> Optional[Entities]:
+    """The KPIs, site / sector, extreme, date window and top-k of a question, or None if they are inconsistent."""
+    vocab = kpi_vocabulary.get()
+    text = normalize_question(question)
+    kpis, rest = _extract_kpis(text)
+
+    sector_id = site_id = None
+    sectors = {f"SITE_{int(n):03d}_SECTOR_{s.upper()}" for n, s in _SECTOR_RE.findall(rest)}
+    rest_without_sectors = _SECTOR_RE.sub(" ", rest)
+    sites = {f"SITE_{int(n):03d}" for n in _SITE_RE.findall(rest_without_sectors)}
+    sites |= {s.rsplit("_SECTOR_", 1)[0] for s in sectors}
+    if len(sectors) > 1 or len(sites) > 1:
+        return None
+    if sectors:
+        sector_id = sectors.pop()
+        if sector_id not in vocab.sectors:
+            return None
+    if sites:
+        site_id = sites.pop()
+        if site_id not in vocab.sites:
+            return None
+
+    high, low = _has_word(rest, HIGH_WORDS), _has_word(rest, LOW_WORDS)
+    if high and low:
+        return None
+    extreme = "highest" if high else "lowest" if low else None
+
+    start_date, end_date, ok = _extract_dates(rest, vocab.first_date, vocab.last_date)
+    if not ok:
+        return None
+
+    top_k = None
+    counts = [int(a or b) for a, b in _TOP_N_RE.findall(rest)]
+    if len(set(counts)) > 1:
+        return None
+    if counts:
+        top_k = counts[0]
+
+    leftover = _TOP_N_RE.sub(" ", _remove_dates(_SITE_RE.sub(" ", rest_without_sectors)))
+    # A year no date phrase consumed ("in 2023") would otherwise be silently ignored
+    if _YEAR_RE.search(leftover):
+        return None
+    unparsed = tuple(w for w in leftover.split() if w not in FILLER_WORDS)
+    return Entities(kpis, site_id, sector_id, extreme, start_date, end_date, top_k, text, unparsed)
+
+
+def route_question(question: str) -> Optional[Intent]:
+    """
+    The return_direct tool call that answers `question`, or None when the
+    question should go to the LLM agent. Only fires when every argument the
+    tool needs was found unambiguously.
+    """
+    try:
+        entities = extract_entities(question)
+    except Exception:
+        return None
+    if entities is None:
+        return None
+    text = entities.text
+    if entities.unparsed or _has_word(text, FALLBACK_WORDS):
+        return None
+    dates = {"start_date": entities.start_date, "end_date": entities.end_date}
+    dates = {k: v for k, v in dates.items() if v is not None}
+
+    if re.search(r"\banomal", text):
+        if not (entities.top_k or _has_word(text, ["top", "most severe", "worst", "biggest", "largest", "strongest"])):
+            return None
+        if len(entities.kpis) > 1:
+            return None
+        args = dict(dates, top_k=entities.top_k or 10)
+        if entities.kpis:
+            args["kpi_name"] = entities.kpis[0]
+        if entities.sector_id:
+            args["sector_id"] = entities.sector_id
+        elif entities.site_id:
+            args["site_id"] = entities.site_id
+        return Intent("get_top_anomalies", args)
+
+    if entities.sector_id:
+        return None
+
+    if _has_word(text, ["leaderboard", "ranking", "rank", "top", "bottom"]) and _has_word(text, ["sites"]):
+        if entities.site_id or _has_word(text, ["day", "date", "when"]):
+            return None
+        return Intent("get_kpi_leaderboard", dict(
+            dates, kpi_names=entities.kpis or "all", top_k=entities.top_k or 5
+        ))
+
+    if len(entities.kpis) != 1 or entities.extreme is None or entities.top_k is not None:
+        return None
+    kpi = entities.kpis[0]
+
+    if _has_word(text, ["sites", "sectors"]):
+        return None
+    if entities.site_id:
+        if not _has_word(text, ["day", "date", "when"]):
+            return None
+        return Intent("get_peak_kpi_day_for_site", dict(
+            dates, site_id=entities.site_id, kpi_name=kpi, extreme_type=entities.extreme
+        ))
+
+    # The tool returns the site and its value only, not the day ("... and when?")
+    if _has_word(text, ["day", "date", "when"]):
+        return None
+    if _has_word(text, ["which site", "what site", "site with", "site had", "site has"]):
+        return Intent("get_site_kpi_extreme", dict(dates, kpi_name=kpi, extreme_type=entities.extreme))
+    return None
@@ -0,0 +1,200 @@
+"""
+Dense sector x day x KPI cube backed by a memory-mapped .npy file.
+
+The cleaned KPI data is a regular grid (every sector reports once a day), so it
+can be stored as a NaN-padded float32 array instead of a long DataFrame:
+
+    Data/KPI_data_cleaned.cube.npy    values[sector, day, kpi]
+    Data/KPI_data_cleaned.cube.json   sector / site / date / KPI index maps
+
+Sectors are ordered by (Site_ID, Sector_ID) so every site is one contiguous
+block of rows and a site query is a plain slice. The file is opened with
+mmap_mode="r", so several uvicorn workers share the same pages through the OS
+page cache instead of each holding a private copy.
+
+Build it with `python build_cache.py --cube`. tools.py uses the cube only when
+it is at least as new as the CSV it was built from.
+"""
+import json
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+def cube_paths(csv_path: str):
+    base = os.path.splitext(csv_path)[0]
+    return base + ".cube.npy", base + ".cube.json"
+
+
+def _grid_layout(df: pd.DataFrame):
+    """
+    Sector order, cell positions and index metadata for a typed KPI frame.
+    Returns (rows, cols, meta) where rows/cols place every row of `df` in the grid.
+    """
+    sector_site = (
+        df[["Sector_ID", "Site_ID"]].astype(str).drop_duplicates("Sector_ID")
+        .sort_values(["Site_ID", "Sector_ID"])
+    )
+    sectors = sector_site["Sector_ID"].tolist()
+    sector_pos = {s: i for i, s in enumerate(sectors)}
+
+    days = df["Date"].values.astype("datetime64[D]")
+    start = days.min() if len(days) else np.datetime64("NaT", "D")
+    n_days = int((days.max() - start).astype(int)) + 1 if len(days) else 0
+
+    sites, site_starts, site_counts = np.unique(
+        sector_site["Site_ID"].to_numpy(), return_index=True, return_counts=True
+    )
+    meta = {
+        "sectors": sectors,
+        "sector_site": sector_site["Site_ID"].tolist(),
+        "site_bounds": {str(s): [int(lo), int(lo + n)] for s, lo, n in zip(sites, site_starts, site_counts)},
+        "start_date": str(start),
+        "n_days": n_days,
+    }
+    rows = df["Sector_ID"].astype(str).map(sector_pos).to_numpy()
+    cols = (days - start).astype(int)
+    return rows, cols, meta
+
+
+def _kpi_columns(df: pd.DataFrame) -> list:
+    return [c for c in df.columns if c not in ["Date", "Site_ID", "Sector_ID"]]
+
+
+def build_cube(csv_path: str, df: pd.DataFrame, kpi_cols: Optional[list] = None) -> str:
+    """
+    Writes the cube for `df` (a typed frame of `csv_path`) and returns the .npy path.
+    Rows with a missing Date or Sector_ID are skipped; missing cells stay NaN.
+    """
+    if kpi_cols is None:
+        kpi_cols = _kpi_columns(df)
+
+    df = df.dropna(subset=["Date", "Sector_ID"])
+    rows, cols, meta = _grid_layout(df)
+    meta["kpis"] = list(kpi_cols)
+
+    npy_path, json_path = cube_paths(csv_path)
+    tmp_path = npy_path + ".tmp"
+    cube = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=np.float32, shape=(len(meta["sectors"]), meta["n_days"], len(kpi_cols))
+    )
+    cube[:] = np.nan
+    cube[rows, cols, :] = df[kpi_cols].to_numpy(dtype=np.float32)
+    cube.flush()
+    del cube
+    os.replace(tmp_path, npy_path)
+
+    with open(json_path, "w") as f:
+        json.dump(meta, f)
+    return npy_path
+
+
+def day_slice(origin, n_days: int, start_date, end_date):
+    """
+    Half-open day slice [lo, hi) covering start_date..end_date inclusive on a
+    daily axis that starts at `origin`, clipped to [0, n_days). Time-of-day is
+    ignored, like comparing against midnight-stamped Date values. Missing (NaT)
+    bounds give an empty slice.
+    """
+    if pd.isna(start_date) or pd.isna(end_date) or pd.isna(origin):
+        return 0, 0
+    origin = pd.Timestamp(origin)
+    lo = int(np.ceil((pd.Timestamp(start_date) - origin) / pd.Timedelta(days=1)))
+    hi = int(np.floor((pd.Timestamp(end_date) - origin) / pd.Timedelta(days=1))) + 1
+    return max(lo, 0), min(hi, n_days)
+
+
+class KPICube:
+    """
+    Read-only sector x day x KPI grid. Cubes opened from disk are memory-mapped
+    and all slices are views into the map; `from_frame` builds the same layout
+    in memory for when no cube file has been built.
+    """
+
+    def __init__(self, values: np.ndarray, meta: dict, file_key=None):
+        self.file_key = file_key
+        self.values = values
+
+        self.sectors = meta["sectors"]
+        self.sector_pos = {s: i for i, s in enumerate(self.sectors)}
+        self.sector_site = np.array(meta["sector_site"])
+        self.site_bounds = {s: tuple(b) for s, b in meta["site_bounds"].items()}
+        self.sites = sorted(self.site_bounds, key=lambda s: self.site_bounds[s][0])
+        self.kpis = meta["kpis"]
+        self.kpi_pos = {k: i for i, k in enumerate(self.kpis)}
+        self.start = np.datetime64(meta["start_date"], "D")
+        self.n_days = meta["n_days"]
+
+    @classmethod
+    def open(cls, npy_path: str, json_path: str, file_key=None) -> "KPICube":
+        with open(json_path) as f:
+            meta = json.load(f)
+        return cls(np.load(npy_path, mmap_mode="r"), meta, file_key)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, kpi_cols: Optional[list] = None) -> "KPICube":
+        """In-memory float64 cube of `kpi_cols` (all KPI columns if None) of a typed KPI frame."""
+        if kpi_cols is None:
+            kpi_cols = _kpi_columns(df)
+        df = df.dropna(subset=["Date", "Sector_ID"])
+        rows, cols, meta = _grid_layout(df)
+        meta["kpis"] = list(kpi_cols)
+
+        values = np.full((len(meta["sectors"]), meta["n_days"], len(kpi_cols)), np.nan)
+        values[rows, cols, :] = df[kpi_cols].to_numpy(dtype=np.float64)
+        return cls(values, meta)
+
+    def date(self, day: int) -> pd.Timestamp:
+        return pd.Timestamp(self.start + np.timedelta64(int(day), "D"))
+
+    def day_range(self, start_date, end_date):
+        """Half-open day slice [lo, hi) of the cube covering start_date..end_date inclusive."""
+        return day_slice(self.start, self.n_days, start_date, end_date)
+
+    def plane(self, kpi: str) -> np.ndarray:
+        """(sectors, days) values of one KPI. Raises KeyError for unknown KPIs."""
+        return self.values[:, :, self.kpi_pos[kpi]]
+
+    def site_rows(self, site_id: str) -> slice:
+        lo, hi = self.site_bounds[site_id]
+        return slice(lo, hi)
+
+    def site_starts(self) -> np.ndarray:
+        """First row of every site, in `self.sites` order (for np.add.reduceat over sectors)."""
+        return np.array([self.site_bounds[s][0] for s in self.sites], dtype=np.intp)
+
+    def last_day(self, kpi: str, site_id: Optional[str] = None) -> Optional[int]:
+        """Last day with any value for `kpi` (network-wide or for one site), or None."""
+        plane = self.plane(kpi)
+        if site_id is not None:
+            plane = plane[self.site_rows(site_id)]
+        has_value = np.flatnonzero((~np.isnan(plane)).any(axis=0))
+        return int(has_value[-1]) if has_value.size else None
+
+
+_open_cubes = {}
+
+
+def load_cube(csv_path: str) -> Optional[KPICube]:
+    """
+    Returns the cube for `csv_path`, or None if it was never built or is older
+    than the CSV. Opened cubes are cached per process and reopened when the
+    cube file is replaced.
+    """
+    npy_path, json_path = cube_paths(csv_path)
+    try:
+        npy_stat = os.stat(npy_path)
+        json_stat = os.stat(json_path)
+        if min(npy_stat.st_mtime, json_stat.st_mtime) < os.path.getmtime(csv_path):
+            return None
+    except OSError:
+        return None
+
+    key = (npy_stat.st_mtime_ns, npy_stat.st_size, json_stat.st_mtime_ns)
+    cached = _open_cubes.get(csv_path)
+    if cached is None or cached[0] != key:
+        cached = (key, KPICube.open(npy_path, json_path, key))
+        _open_cubes[csv_path] = cached
+    return cached[1]
@@ -0,0 +1,154 @@
+"""
+Disk + in-memory cache of fitted IsolationForest models.
+
+Every model is stored once with joblib under
+
+    Data/if_models/<Sector_ID>/<KPI>-<key>.joblib
+
+where `key` hashes the hyperparameters, the scikit-learn version, the cache
+format version and a fingerprint of the exact training values. A rerun on
+unchanged data (or a rescore of a series that did not change) loads the model
+instead of refitting it; any change to the data or the parameters gives a new
+key, so stale models are never picked up. Loaded models are kept in a
+per-process LRU. Since every change gives new files, a full detection run
+prunes the models it did not use (IFModelCache.prune).
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+import sklearn
+from sklearn.ensemble import IsolationForest
+
+MODEL_CACHE_DIR = os.path.join("Data", "if_models")
+
+# Bump when the stored object layout changes
+CACHE_FORMAT_VERSION = 1
+
+
+def training_fingerprint(values) -> str:
+    """Hash of the training values (float64, in order) and their shape."""
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    return hashlib.md5(str(values.shape).encode() + values.tobytes()).hexdigest()
+
+
+def model_key(params: dict, values) -> str:
+    header = json.dumps(
+        {"format": CACHE_FORMAT_VERSION, "sklearn": sklearn.__version__, "params": params}, sort_keys=True
+    )
+    return hashlib.md5(f"{header}|{training_fingerprint(values)}".encode()).hexdigest()
+
+
+class IFModelCache:
+    """
+    IsolationForest models keyed by (Sector_ID, KPI, model_key). `get` looks in
+    the LRU, then on disk; `fit` returns the cached model for the same data and
+    parameters or fits, stores and returns a new one. With `cache_dir=None`
+    nothing is written to disk.
+    """
+
+    def __init__(self, cache_dir: str = MODEL_CACHE_DIR, max_models: int = 512):
+        self.cache_dir = cache_dir
+        self.max_models = max_models
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "fits": 0, "evictions": 0}
+
+    def path(self, sector_id: str, kpi: str, key: str) -> str:
+        return os.path.join(self.cache_dir, str(sector_id), f"{kpi}-{key}.joblib")
+
+    def _remember(self, lru_key, model):
+        self._lru[lru_key] = model
+        self._lru.move_to_end(lru_key)
+        while len(self._lru) > self.max_models:
+            self._lru.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, sector_id: str, kpi: str, key: str):
+        """The cached model or None."""
+        lru_key = (sector_id, kpi, key)
+        with self._lock:
+            if lru_key in self._lru:
+                self._lru.move_to_end(lru_key)
+                self.stats["memory_hits"] += 1
+                return self._lru[lru_key]
+        if self.cache_dir is None:
+            return None
+        path = self.path(sector_id, kpi, key)
+        if not os.path.exists(path):
+            return None
+        model = joblib.load(path)
+        with self._lock:
+            self.stats["disk_hits"] += 1
+            self._remember(lru_key, model)
+        return model
+
+    def put(self, sector_id: str, kpi: str, key: str, model):
+        if self.cache_dir is not None:
+            path = self.path(sector_id, kpi, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            joblib.dump(model, tmp_path, compress=3)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._remember((sector_id, kpi, key), model)
+
+    def fit(self, sector_id: str, kpi: str, values, **params):
+        """
+        IsolationForest(**params) fitted on `values` (1-D series or 2-D
+        samples x features, no NaN), from the cache when possible. Returns
+        `(model, key)`.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        key = model_key(params, values)
+        model = self.get(sector_id, kpi, key)
+        if model is None:
+            model = IsolationForest(**params).fit(values.reshape(-1, 1) if values.ndim == 1 else values)
+            with self._lock:
+                self.stats["fits"] += 1
+            self.put(sector_id, kpi, key, model)
+        return model, key
+
+    def prune(self, keep) -> tuple:
+        """
+        Deletes every cached model whose `(Sector_ID, KPI)` is not in `keep`
+        (a dict `{(Sector_ID, KPI): key}`) or whose key differs from the kept
+        one. Returns `(files removed, bytes freed)`.
+        """
+        removed, freed = 0, 0
+        with self._lock:
+            for lru_key in [k for k in self._lru if keep.get(k[:2]) != k[2]]:
+                del self._lru[lru_key]
+        if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+            return removed, freed
+        for sector_id in os.listdir(self.cache_dir):
+            sector_dir = os.path.join(self.cache_dir, sector_id)
+            if not os.path.isdir(sector_dir):
+                continue
+            for name in os.listdir(sector_dir):
+                if not name.endswith(".joblib"):
+                    continue
+                kpi, _, key = name[:-len(".joblib")].rpartition("-")
+                if keep.get((sector_id, kpi)) == key:
+                    continue
+                path = os.path.join(sector_dir, name)
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed += 1
+            if not os.listdir(sector_dir):
+                os.rmdir(sector_dir)
+        return removed, freed
+
+
+_caches = {}
+
+
+def model_cache(cache_dir: str = MODEL_CACHE_DIR) -> IFModelCache:
+    """Process-wide IFModelCache for `cache_dir` (each worker process gets its own LRU)."""
+    if cache_dir not in _caches:
+        _caches[cache_dir] = IFModelCache(cache_dir)
+    return _caches[cache_dir]
@@ -0,0 +1,155 @@
+"""
+Cold-start benchmark for the agent.
+
+Every measurement runs in a fresh interpreter:
+
+    python startup_benchmark.py               # import breakdown + time to first request
+    python startup_benchmark.py --baseline    # exit 1 if anything is slower than startup_baseline.json
+    python startup_benchmark.py --save        # refresh startup_baseline.json after an intended change
+
+startup_baseline.json is checked in; the timings depend on the machine it was
+recorded on (stored under "machine"), so refresh it with --save when the
+reference machine changes.
+
+The import breakdown is `python -X importtime -c "import <module>"` with the
+self time of every imported module summed per top-level package, so the heavy
+dependencies pulled in at import are easy to spot. Time to first request is
+`import Agent` plus the first `agent_executor.invoke`; the default question is
+answered by the intent router, so it needs neither API keys nor network (an
+LLM question would additionally build the graph, see Agent.get_app).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+DEFAULT_MODULES = ["tools", "Agent"]
+DEFAULT_QUESTION = "Which site had the highest SINR last week?"
+BASELINE_PATH = "startup_baseline.json"
+
+FIRST_REQUEST_CODE = """
+import json, sys, time
+t0 = time.perf_counter()
+import Agent
+t1 = time.perf_counter()
+result = Agent.agent_executor.invoke({"input": sys.argv[1], "chat_history": []})
+t2 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "first_request": t2 - t1, "total": t2 - t0,
+                  "answer": result["messages"][-1].content[:80]}))
+"""
+
+
+def _run(label: str, args: list) -> subprocess.CompletedProcess:
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.run([sys.executable] + args, cwd=cwd, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"{label} failed: {process.stderr.strip().splitlines()[-1:]}")
+    return process
+
+
+def _path(path: str) -> str:
+    """`path` relative to the repository (where the baseline lives) unless absolute."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+
+def parse_importtime(stderr: str, module: str):
+    """`(seconds to import module, {top-level package: self seconds})` from -X importtime output."""
+    packages = defaultdict(float)
+    total = 0.0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Interpreter startup (site, encodings, ...) is listed before the module itself
+        packages[name.strip().split(".")[0]] += int(self_us) / 1e6
+        if name.rstrip() == f" {module}":
+            total = int(cumulative_us) / 1e6
+    return total, dict(packages)
+
+
+def import_breakdown(module: str, repeats: int = 3):
+    """Median import time of `module` and the per-package breakdown of the fastest run."""
+    runs = [parse_importtime(_run(f"import {module}", ["-X", "importtime", "-c", f"import {module}"]).stderr, module)
+            for _ in range(repeats)]
+    return statistics.median(t for t, _ in runs), min(runs, key=lambda run: run[0])[1]
+
+
+def time_to_first_request(question: str = DEFAULT_QUESTION, repeats: int = 3) -> dict:
+    """Median import / first-request / total seconds of a fresh `import Agent` + one invoke."""
+    runs = [json.loads(_run("first request", ["-c", FIRST_REQUEST_CODE, question]).stdout.strip().splitlines()[-1])
+            for _ in range(repeats)]
+    timings = {key: statistics.median(run[key] for run in runs) for key in ("import", "first_request", "total")}
+    timings["answer"] = runs[-1]["answer"]
+    return timings
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta: float = 0.1) -> list:
+    """
+    Metrics (name, value, baseline value) more than `tolerance` (relative) and
+    `min_delta` seconds slower than the baseline; the absolute floor keeps
+    millisecond-sized metrics from flagging on noise.
+    """
+    regressions = []
+    for name, value in results.items():
+        reference = baseline.get(name)
+        if isinstance(value, float) and isinstance(reference, (int, float)) and \
+                value > reference * (1 + tolerance) and value - reference > min_delta:
+            regressions.append((name, value, reference))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and time to first request of the agent.")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="modules to profile the import of")
+    parser.add_argument("--question", default=DEFAULT_QUESTION, help="question for the time-to-first-request run")
+    parser.add_argument("--no-first-request", action="store_true",
+                        help="skip the time-to-first-request run (e.g. without the Agent dependencies)")
+    parser.add_argument("--repeats", type=int, default=3, help="fresh interpreters per measurement (median)")
+    parser.add_argument("--top", type=int, default=15, help="packages to list per module")
+    parser.add_argument("--save", nargs="?", const=BASELINE_PATH,
+                        help="write the results as JSON (default file: %(const)s)")
+    parser.add_argument("--baseline", nargs="?", const=BASELINE_PATH,
+                        help="results written by --save to compare against (default file: %(const)s)")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed relative slowdown against the baseline (default: %(default)s)")
+    parser.add_argument("--min-delta", type=float, default=0.1,
+                        help="slowdowns below this many seconds are never reported (default: %(default)s)")
+    args = parser.parse_args()
+
+    results = {}
+    for module in args.modules:
+        total, packages = import_breakdown(module, args.repeats)
+        results[f"import {module}"] = total
+        print(f"import {module}: {total:.3f}s")
+        for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {package:<32} {seconds:7.3f}s")
+
+    if not args.no_first_request:
+        timings = time_to_first_request(args.question, args.repeats)
+        for key in ("import", "first_request", "total"):
+            results[f"first request: {key}"] = timings[key]
+        print(f"time to first request: {timings['total']:.3f}s "
+              f"(import Agent {timings['import']:.3f}s + first invoke {timings['first_request']:.3f}s)")
+        print(f"    {args.question!r} -> {timings['answer']!r}")
+
+    if args.save:
+        machine = {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+        with open(_path(args.save), "w") as f:
+            json.dump(dict({k: round(v, 3) for k, v in results.items()}, machine=machine), f, indent=2)
+            f.write("\n")
+
+    if args.baseline:
+        with open(_path(args.baseline)) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta)
+        for name, value, reference in regressions:
+            print(f"REGRESSION {name}: {value:.3f}s vs {reference:.3f}s baseline")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
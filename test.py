@@ -216,11 +216,273 @@ def test_invalid_kpi():
     print(result)
     print("-" * 80)
 
+def test_granger_engine_matches_statsmodels():
+    print("Test 5: Batched Granger engine vs statsmodels grangercausalitytests")
+    import contextlib
+    import io
+    from statsmodels.tsa.stattools import grangercausalitytests
+    from tools import granger_ssr_ftest
+
+    df = pd.read_csv("Data/KPI_data_cleaned.csv")
+    pairs = [("Active_Users", "CPU_Utilization"), ("SINR", "DL_Throughput"), ("RTT", "Packet_Loss")]
+    sectors = df["Sector_ID"].unique()[:20]
+
+    worst_p = 0.0
+    for kpi_x, kpi_y in pairs:
+        series = [df[df["Sector_ID"] == s].sort_values("Date") for s in sectors]
+        lengths = np.array([len(s) for s in series])
+        y = np.zeros((len(series), lengths.max()))
+        x = np.zeros((len(series), lengths.max()))
+        for i, s in enumerate(series):
+            y[i, :lengths[i]] = s[kpi_y].to_numpy()
+            x[i, :lengths[i]] = s[kpi_x].to_numpy()
+        _, p_batch = granger_ssr_ftest(y, x, maxlag=2, lengths=lengths)
+
+        for i in range(len(series)):
+            with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+                warnings.simplefilter("ignore")
+                result = grangercausalitytests(np.column_stack([y[i, :lengths[i]], x[i, :lengths[i]]]), maxlag=2)
+            for lag in (1, 2):
+                worst_p = max(worst_p, abs(result[lag][0]["ssr_ftest"][1] - p_batch[i, lag - 1]))
+
+    print(f"Max absolute p-value difference: {worst_p:.2e}")
+    assert worst_p < 1e-8
+    print("-" * 80)
+
+def test_intent_router_falls_back_on_unparsed_words():
+    print("Test 6: Intent router only answers questions it fully parsed")
+    from intent_router import route_question
+
+    # A year without a date phrase, or a word that is not a KPI / ID / date / filler word, goes to the LLM
+    for question in [
+        "Which site had the highest SINR in 2023?",
+        "Which site had the highest handover failure rate last week?",
+        "Which site has the highest CPU temperature?",
+        "Which site has the highest drop rate of handovers?",
+        # Qualified periods, a list of dates and a question part the tool does not answer
+        "Which site had the highest SINR before last week?",
+        "Which site had the highest SINR after last week?",
+        "Which site had the highest SINR since last week?",
+        "Which site had the highest SINR on 2024-02-10 and 2024-02-12?",
+        "What site had the highest SINR and when?",
+    ]:
+        intent = route_question(question)
+        print(f"{question} -> {intent}")
+        assert intent is None
+
+    intent = route_question("Which site had the highest SINR last week?")
+    print(intent)
+    assert intent is not None and intent.tool == "get_site_kpi_extreme"
+
+    intent = route_question("Which site had the highest SINR between 2024-02-10 and 2024-02-12?")
+    print(intent)
+    assert intent is not None and (intent.args["start_date"], intent.args["end_date"]) == ("2024-02-10", "2024-02-12")
+    print("-" * 80)
+
+def test_answer_cache_keeps_negations_and_numbers_exact():
+    print("Test 7: Answer cache does not serve negated or re-dated rewordings")
+    from answer_cache import AnswerCache
+
+    cache = AnswerCache()
+    cache.put("Why is SINR low at SITE_001?", "v1", "low SINR answer")
+    cache.put("What is the average SINR at SITE_001?", "v1", "average SINR answer")
+    assert cache.get("Why is the SINR low at SITE_001?", "v1") == "low SINR answer"
+    for question in [
+        "Why is SINR not low at SITE_001?",
+        "Why is SINR never low at SITE_001?",
+        "Why isn't SINR low at SITE_001?",
+        "Why is SINR low at SITE_001 in 2023?",
+        "What is the average SINR at SITE_001 in 2023?",
+    ]:
+        answer = cache.get(question, "v1")
+        print(f"{question} -> {answer}")
+        assert answer is None
+
+    # Word overlap alone would match these opposite questions
+    for cached, question in [
+        ("Explain why DL throughput rose sharply at SITE_001 in February compared with the rest of the sites",
+         "Explain why DL throughput dropped sharply at SITE_001 in February compared with the rest of the sites"),
+        ("Why is the SINR high at SITE_001 during February and what should the field team check first",
+         "Why is the SINR low at SITE_001 during February and what should the field team check first"),
+        ("Did RTT increase at SITE_002 in February?", "Did RTT decrease at SITE_002 in February?"),
+        ("Which sector of SITE_003 had the best SINR in February?", "Which sector of SITE_003 had the worst SINR in February?"),
+    ]:
+        cache.put(cached, "v1", "cached answer")
+        answer = cache.get(question, "v1")
+        print(f"{question} -> {answer}")
+        assert answer is None
+    print("-" * 80)
+
+def test_dwt_batch_matches_single_series():
+    print("Test 8: Batched DWT-MLEAD vs dwt_mlead_anomaly_detection on series of different lengths")
+    from anomaly_detection import dwt_mlead_anomaly_detection, dwt_mlead_batch
+
+    df = pd.read_csv("Data/KPI_data_cleaned.csv")
+    rng = np.random.default_rng(0)
+    sectors = df["Sector_ID"].unique()[:30]
+
+    worst_z = 0.0
+    for kpi in ["SINR", "RTT", "CPU_Utilization"]:
+        # Cut every sector to its own length so the batch groups several lengths
+        series = [df[df["Sector_ID"] == s].sort_values("Date")[kpi].reset_index(drop=True) for s in sectors]
+        series = [s.iloc[:rng.integers(20, len(s) + 1)] for s in series]
+        lengths = np.array([len(s) for s in series])
+        values = np.zeros((len(series), lengths.max()))
+        for i, s in enumerate(series):
+            values[i, :lengths[i]] = s.to_numpy()
+        with warnings.catch_warnings():
+            # Short series are below the level-3 decomposition length
+            warnings.simplefilter("ignore")
+            residual_batch = dwt_mlead_batch(values, lengths)
+            single = [dwt_mlead_anomaly_detection(s) for s in series]
+
+        for i, (indices, residual_z) in enumerate(single):
+            worst_z = max(worst_z, np.max(np.abs(residual_z - residual_batch[i, :lengths[i]])))
+            assert np.isnan(residual_batch[i, lengths[i]:]).all()
+            assert np.array_equal(indices, np.where(np.abs(residual_batch[i, :lengths[i]]) > 2)[0])
+
+    print(f"Max absolute residual z-score difference: {worst_z:.2e}")
+    assert worst_z < 1e-8
+    print("-" * 80)
+
+def test_if_flags_match_fit_predict():
+    print("Test 9: One-forest Isolation Forest scores + if_flags vs per-contamination fit_predict")
+    from sklearn.ensemble import IsolationForest
+    from anomaly_detection import IF_KPIS, IF_RANDOM_STATE, if_flags, isolation_forest_scores
+
+    df = pd.read_csv("Data/KPI_data_cleaned.csv")
+    sectors = df["Sector_ID"].unique()[:10]
+
+    rows = []
+    for kpi in IF_KPIS[:3]:
+        for sector in sectors:
+            series = df[df["Sector_ID"] == sector].sort_values("Date")[kpi].to_numpy()
+            rows.append(pd.DataFrame({"KPI": kpi, "Sector_ID": sector, "value": series,
+                                      "if_score": isolation_forest_scores(series)}))
+    scores = pd.concat(rows, ignore_index=True)
+
+    mismatches = 0
+    for contamination in [0.03, 0.05, 0.1]:
+        flags = if_flags(scores, contamination)
+        expected = np.concatenate([
+            IsolationForest(n_estimators=100, contamination=contamination, random_state=IF_RANDOM_STATE)
+            .fit_predict(group["value"].to_numpy().reshape(-1, 1)) == -1
+            for _, group in scores.groupby(["KPI", "Sector_ID"], sort=False)
+        ])
+        mismatches += int((flags != expected).sum())
+        print(f"contamination={contamination}: {int(flags.sum())} flagged, {int((flags != expected).sum())} differ")
+
+    assert mismatches == 0
+    print("-" * 80)
+
+def test_range_extreme_table_matches_idxmax():
+    print("Test 10: RangeExtremeTable vs pandas idxmax / idxmin over random day ranges")
+    from tools import RangeExtremeTable
+
+    rng = np.random.default_rng(0)
+    df = pd.read_csv("Data/KPI_data_cleaned.csv")
+    df["Date"] = pd.to_datetime(df["Date"])
+    days = pd.date_range(df["Date"].min(), df["Date"].max())
+
+    mismatches = 0
+    for site in df["Site_ID"].unique()[:5]:
+        for kpi in ["SINR", "Call_Drop_Rate"]:
+            # Rounded so ties between sectors and days are common
+            block = (df[df["Site_ID"] == site].pivot_table(index="Sector_ID", columns="Date", values=kpi)
+                     .reindex(columns=days).rename_axis(columns="Date").round(1))
+            long = block.stack().dropna().rename("value").reset_index()
+            long["day"] = days.get_indexer(long["Date"])
+            for lowest in (False, True):
+                table = RangeExtremeTable(block.to_numpy(), lowest)
+                for _ in range(200):
+                    lo, hi = sorted(int(d) for d in rng.integers(0, len(days) + 1, size=2))
+                    hit = table.query(lo, hi)
+                    rows = long[(long["day"] >= lo) & (long["day"] < hi)]
+                    if rows.empty:
+                        mismatches += hit is not None
+                        continue
+                    row = rows.loc[rows["value"].idxmin() if lowest else rows["value"].idxmax()]
+                    expected = (block.index.get_loc(row["Sector_ID"]), row["day"], row["value"])
+                    mismatches += hit != expected
+
+    print(f"Mismatching ranges: {mismatches}")
+    assert mismatches == 0
+    print("-" * 80)
+
+def test_anomaly_index_cooccurrence_matches_pandas():
+    print("Test 11: AnomalyIndex co-occurrence counts vs pandas filtering of the anomaly rows")
+    from anomaly_index import AnomalyIndex
+    from tools import anomaly_store
+
+    df = anomaly_store.get()
+    index = AnomalyIndex(df)
+
+    mismatches = 0
+    for site_id, start, end in [(None, None, None), ("SITE_001", None, None), (None, "2024-01-15", "2024-02-10"),
+                                ("SITE_004", "2024-02-01", "2024-02-29")]:
+        scope = df if site_id is None else df[df["Site_ID"] == site_id]
+        if start is not None:
+            scope = scope[(scope["Date"] >= start) & (scope["Date"] <= end)]
+        day_lo, day_hi = index.day_range(start, end)
+        for same_sector in (False, True):
+            counts = index.cooccurrence(*index.sector_range(site_id), day_lo, day_hi, same_sector=same_sector)
+            keys = ["Sector_ID", "Date"] if same_sector else ["Date"]
+            for x, kpi_x in enumerate(index.kpis):
+                x_keys = scope.loc[scope["KPI"] == kpi_x, keys].drop_duplicates()
+                for y, kpi_y in enumerate(index.kpis):
+                    expected = len(scope[scope["KPI"] == kpi_y].merge(x_keys, on=keys))
+                    mismatches += int(counts[x, y] != expected)
+
+    print(f"Mismatching counts: {mismatches}")
+    assert mismatches == 0
+    print("-" * 80)
+
+def test_anomaly_index_lag_counts_match_pandas():
+    print("Test 12: AnomalyIndex lagged co-occurrence vs pandas shifted-date joins")
+    from anomaly_index import AnomalyIndex
+    from tools import anomaly_store
+
+    df = anomaly_store.get()
+    index = AnomalyIndex(df)
+
+    mismatches = 0
+    for site_id, start, end, max_lag in [(None, None, None, 3), ("SITE_002", None, None, 7),
+                                         (None, "2024-01-20", "2024-02-15", 2)]:
+        scope = df if site_id is None else df[df["Site_ID"] == site_id]
+        if start is not None:
+            scope = scope[(scope["Date"] >= start) & (scope["Date"] <= end)]
+        day_lo, day_hi = index.day_range(start, end)
+        for same_sector in (True, False):
+            followed, events, _ = index.lagged_cooccurrence(*index.sector_range(site_id), day_lo, day_hi,
+                                                            max_lag=max_lag, same_sector=same_sector)
+            keys = ["Sector_ID", "Date"] if same_sector else ["Date"]
+            for x, kpi_x in enumerate(index.kpis):
+                x_events = scope.loc[scope["KPI"] == kpi_x, keys].drop_duplicates()
+                mismatches += int(events[x] != len(x_events))
+                for y, kpi_y in enumerate(index.kpis):
+                    y_events = scope.loc[scope["KPI"] == kpi_y, keys].drop_duplicates()
+                    # An x event is followed when y has an event 1..max_lag days later
+                    later = pd.concat([y_events.assign(Date=y_events["Date"] - pd.Timedelta(days=lag))
+                                       for lag in range(1, max_lag + 1)]).drop_duplicates()
+                    mismatches += int(followed[x, y] != len(x_events.merge(later, on=keys)))
+
+    print(f"Mismatching counts: {mismatches}")
+    assert mismatches == 0
+    print("-" * 80)
+
 if __name__ == "__main__":
     test_basic_dl_throughput()
     test_with_site()
     test_with_sector_and_dates()
     test_invalid_kpi()
+    test_granger_engine_matches_statsmodels()
+    test_intent_router_falls_back_on_unparsed_words()
+    test_answer_cache_keeps_negations_and_numbers_exact()
+    test_dwt_batch_matches_single_series()
+    test_if_flags_match_fit_predict()
+    test_range_extreme_table_matches_idxmax()
+    test_anomaly_index_cooccurrence_matches_pandas()
+    test_anomaly_index_lag_counts_match_pandas()
 
 # import requests
 # from langchain_core.messages import HumanMessage, AIMessage, messages_to_dict
@@ -0,0 +1,133 @@
+"""
+Memoization of agent tool results.
+
+The agent asks the same questions with differently spelled but equivalent
+arguments ("site_001" / "SITE_001", "01.02.24" / "2024-02-01", no end date /
+the last date of the data). ToolResultCache.memoize wraps a tool function so
+that its arguments are first passed through a normalizer, which maps every
+spelling to one canonical form (and rejects invalid values), and the tool runs
+on the canonical arguments. Results are kept in a size-bounded LRU keyed by
+(tool name, data version, canonical arguments); when the data version changes
+the whole LRU is dropped, so a rewritten CSV is never answered from stale
+entries.
+
+`wrapper.async_version(run)` gives the same tool as a coroutine function. The
+normalization (which may load the data) and, on a miss, the tool itself are
+handed to `run(fn, *args, **kwargs)` (e.g. a thread pool, see
+tool_executor.py); only the LRU lookup happens on the event loop.
+"""
+import functools
+import inspect
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+
+def _freeze(value):
+    """Hashable form of an argument value (lists become tuples)."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+class ToolResultCache:
+    """
+    LRU of tool results. `version()` returns the current data version (any
+    hashable); `normalize(tool_name, args)` returns the canonical arguments or
+    raises ValueError. Results for which `cacheable(result)` is False (by
+    default error strings) are returned but not stored.
+    """
+
+    def __init__(self, version: Callable[[], object], normalize: Optional[Callable] = None,
+                 max_entries: int = 1024, cacheable: Optional[Callable] = None):
+        self.version = version
+        self.normalize = normalize
+        self.max_entries = max_entries
+        self.cacheable = cacheable or (lambda result: not (isinstance(result, str) and result.startswith("Error")))
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        self._version = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    def _lookup(self, key, version):
+        with self._lock:
+            if version != self._version:
+                if self._lru:
+                    self.stats["invalidations"] += 1
+                self._lru.clear()
+                self._version = version
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.stats["hits"] += 1
+                return True, self._lru[key]
+            self.stats["misses"] += 1
+            return False, None
+
+    def _store(self, key, version, result):
+        with self._lock:
+            if version != self._version:
+                return
+            self._lru[key] = result
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def _arguments(self, fn, signature, args, kwargs):
+        """`(canonical arguments, data version, error message or None)` of a call."""
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        if self.normalize is not None:
+            try:
+                arguments = self.normalize(fn.__name__, arguments)
+            except ValueError as e:
+                return arguments, None, f"Error processing request: {str(e)}"
+        return arguments, self.version(), None
+
+    def _finish(self, key, version, result):
+        if self.cacheable(result):
+            self._store(key, version, result)
+        return result
+
+    def memoize(self, fn):
+        """Decorator for a tool function; keeps its signature and docstring for @tool."""
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            arguments, version, error = self._arguments(fn, signature, args, kwargs)
+            if error is not None:
+                return error
+            key = (fn.__name__, _freeze(arguments))
+            found, result = self._lookup(key, version)
+            if found:
+                return result
+            return self._finish(key, version, fn(**arguments))
+
+        def async_version(run):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                # Normalizing may load the data (vocabulary, date grids), so only the lookup stays on the loop
+                arguments, version, error = await run(self._arguments, fn, signature, args, kwargs)
+                if error is not None:
+                    return error
+                key = (fn.__name__, _freeze(arguments))
+                found, result = self._lookup(key, version)
+                if found:
+                    return result
+                return self._finish(key, version, await run(fn, **arguments))
+            return async_wrapper
+
+        wrapper.cache = self
+        wrapper.async_version = async_version
+        return wrapper
+
+    def info(self) -> dict:
+        with self._lock:
+            return dict(self.stats, entries=len(self._lru), max_entries=self.max_entries)
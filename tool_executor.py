@@ -0,0 +1,40 @@
+"""
+Bounded thread pool the async tool versions run their work in.
+
+Tool calls emitted in one LLM turn are awaited together by the ToolNode, so
+the turn takes as long as the slowest call. The work itself runs off the
+event loop in a shared pool of TOOL_THREADS workers, created on first use.
+The tools are numpy / pandas work (the Granger engine is batched numpy too),
+which releases the GIL, so threads are enough and share the in-memory data
+stores.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+TOOL_THREADS = int(os.getenv("TOOL_THREADS", min(8, (os.cpu_count() or 1) + 4)))
+
+_lock = threading.Lock()
+_pool = None
+
+
+def thread_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=TOOL_THREADS, thread_name_prefix="tool")
+        return _pool
+
+
+async def run_in_thread(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(thread_pool(), partial(fn, *args, **kwargs))
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
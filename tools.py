@@ -1,17 +1,711 @@
 import pandas as pd
 from datetime import datetime, timedelta
-from langchain.tools import tool
-from statsmodels.tsa.stattools import grangercausalitytests
-import warnings
-from typing import Optional
-import matplotlib.pyplot as plt
+from langchain_core.tools import tool
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import Optional, List, Union
 import numpy as np
 import os
-import requests
+import hashlib
+import re
+import threading
+from kpi_cube import KPICube, load_cube, day_slice
+from anomaly_index import AnomalyIndex
+from tool_cache import ToolResultCache
+from tool_executor import run_in_thread
+
+KPI_CSV_PATH = os.path.join("Data", "KPI_data_cleaned.csv")
+ANOMALY_CSV_PATH = os.path.join("Data", "df_ensemble.csv")
+ANOMALY_SCORES_PATH = os.path.join("Data", "anomaly_scores.npz")
+
+ID_COLUMNS = ["Site_ID", "Sector_ID", "KPI"]
+KEY_COLUMNS = ["KPI", "Date", "Site_ID", "Sector_ID"]
+
+
+def _file_digest(path: str) -> str:
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _type_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Date -> datetime, ID columns -> category, everything else -> float64."""
+    for col in df.columns:
+        if col == "Date":
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        elif col in ID_COLUMNS:
+            df[col] = df[col].astype("category")
+        else:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    return df
+
+
+# ---------------------------------------------------------------------------
+# Columnar sidecars
+#
+# `Data/<name>.csv` gets a typed `Data/<name>.npz` next to it (see
+# build_cache.py). Every column is its own array inside the archive, and NpzFile
+# only reads the members that are accessed, so loading one KPI touches just
+# that column plus the key columns. Categorical columns are stored as int32
+# codes + a unicode category table, so no pickling is involved.
+# ---------------------------------------------------------------------------
+
+def sidecar_path(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + ".npz"
+
+
+def sidecar_is_fresh(csv_path: str) -> bool:
+    """True if the .npz sidecar exists and is at least as new as its CSV."""
+    npz_path = sidecar_path(csv_path)
+    return (
+        os.path.exists(npz_path)
+        and os.path.getmtime(npz_path) >= os.path.getmtime(csv_path)
+    )
+
+
+def write_sidecar(csv_path: str) -> str:
+    """Parse `csv_path` once and write its typed columnar sidecar. Returns the sidecar path."""
+    df = _type_columns(pd.read_csv(csv_path))
+    arrays = {
+        "__columns__": np.array(df.columns, dtype=str),
+        "__source_md5__": np.array(_file_digest(csv_path)),
+    }
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            arrays[f"{col}.codes"] = df[col].cat.codes.to_numpy(dtype=np.int32)
+            arrays[f"{col}.categories"] = np.array(df[col].cat.categories, dtype=str)
+        else:
+            arrays[col] = df[col].to_numpy()
+
+    npz_path = sidecar_path(csv_path)
+    tmp_path = npz_path + ".tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, npz_path)
+    return npz_path
+
+
+def npz_column_names(npz) -> list:
+    """Column names of an open columnar .npz as plain str (np.load returns np.str_ elements)."""
+    return [str(c) for c in npz["__columns__"]]
+
+
+def read_npz_columns(npz_path: str, columns: Optional[list] = None):
+    """
+    Loads `columns` (all if None) of a columnar .npz (sidecar layout) as a
+    DataFrame. Returns `(df, source_md5)`.
+    """
+    with np.load(npz_path) as npz:
+        available = npz_column_names(npz)
+        wanted = available if columns is None else [c for c in available if c in columns]
+        data = {}
+        for col in wanted:
+            if col in npz.files:
+                data[col] = npz[col]
+            else:
+                data[col] = pd.Categorical.from_codes(
+                    npz[f"{col}.codes"], categories=npz[f"{col}.categories"]
+                )
+        return pd.DataFrame(data), str(npz["__source_md5__"])
+
+
+def read_csv_columns(csv_path: str, columns: Optional[list] = None):
+    """
+    Loads `columns` (all if None) of a KPI CSV as a typed DataFrame.
+
+    Reads the .npz sidecar when it is fresh and falls back to parsing the CSV
+    (with `usecols`) otherwise. Returns `(df, source_md5)`; the hash is only
+    known when it was read from the sidecar.
+    """
+    if sidecar_is_fresh(csv_path):
+        return read_npz_columns(sidecar_path(csv_path), columns)
+
+    usecols = None if columns is None else (lambda c: c in columns)
+    return _type_columns(pd.read_csv(csv_path, usecols=usecols)), None
+
+
+def read_csv_header(csv_path: str) -> list:
+    if sidecar_is_fresh(csv_path):
+        with np.load(sidecar_path(csv_path)) as npz:
+            return npz_column_names(npz)
+    return list(pd.read_csv(csv_path, nrows=0).columns)
+
+
+class KPIDataStore:
+    """
+    Process-wide, read-only cache of one of the KPI CSV files.
+
+    Columns are loaded lazily: `get([kpi])` loads the key columns
+    (Date/Site_ID/Sector_ID, plus KPI for the anomaly file) and `kpi`, reading
+    from the columnar sidecar when it is fresh. Later calls only load columns
+    that have not been seen yet.
+
+    Each `get()` stats the CSV; when its mtime or size changes the content hash
+    is compared and the cache is dropped only if the bytes actually differ.
+
+    Callers must treat the returned DataFrame as immutable.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._df = None
+        self._columns = None
+        self._stat = None
+        self._digest = None
+        self.stats = {"hits": 0, "reloads": 0, "hash_checks": 0, "column_loads": 0}
+
+    def _check_source(self):
+        """Drop the cache if the CSV changed on disk. Caller holds the lock."""
+        st = os.stat(self.path)
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if self._columns is not None and stat_key == self._stat:
+            return
+
+        if self._columns is not None:
+            self.stats["hash_checks"] += 1
+            digest = _file_digest(self.path)
+            self._stat = stat_key
+            if digest == self._digest:
+                # Touched but unchanged (e.g. copied over with the same bytes)
+                return
+            self._digest = digest
+        else:
+            self._stat = stat_key
+            self._digest = None
+
+        self._columns = read_csv_header(self.path)
+        self._df = None
+        self.stats["reloads"] += 1
+
+    @property
+    def columns(self) -> list:
+        with self._lock:
+            self._check_source()
+            return list(self._columns)
+
+    def get(self, columns: Optional[list] = None) -> pd.DataFrame:
+        """
+        Returns the key columns plus `columns` (all columns if None).
+        Raises KeyError for columns that are not in the file.
+        """
+        with self._lock:
+            self._check_source()
+
+            if columns is None:
+                columns = self._columns
+            unknown = [c for c in columns if c not in self._columns]
+            if unknown:
+                raise KeyError(unknown)
+
+            keys = [c for c in KEY_COLUMNS if c in self._columns]
+            wanted = [c for c in self._columns if c in keys or c in columns]
+            loaded = [] if self._df is None else list(self._df.columns)
+            missing = [c for c in wanted if c not in loaded]
+
+            if not missing:
+                self.stats["hits"] += 1
+            else:
+                part, digest = read_csv_columns(self.path, missing)
+                if self._digest is None:
+                    self._digest = digest or _file_digest(self.path)
+                if self._df is None:
+                    self._df = part
+                else:
+                    self._df = pd.concat([self._df, part], axis=1)
+                self._df = self._df[[c for c in self._columns if c in self._df.columns]]
+                self.stats["column_loads"] += len(missing)
+
+            if len(wanted) == self._df.shape[1]:
+                return self._df
+            return self._df[wanted]
+
+    @property
+    def version(self) -> Optional[str]:
+        """Content hash of the current source file, or None before the first load."""
+        return self._digest
+
+
+kpi_store = KPIDataStore(KPI_CSV_PATH)
+anomaly_store = KPIDataStore(ANOMALY_CSV_PATH)
+
+
+class AnomalyScoreStore:
+    """
+    Process-wide, read-only cache of the continuous anomaly scores written by
+    anomaly_detection.py (one row per scored KPI point, see save_scores there).
+
+    Like KPIDataStore, columns are loaded lazily: `get([col])` reads the key
+    columns (KPI/Site_ID/Sector_ID/Date) and `col` from the .npz only. The cache
+    is dropped when the file's mtime or size changes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._df = None
+        self._stat = None
+        self._columns = None
+        self.ensemble_settings = None
+        self.source_md5 = None
+        self.stats = {"hits": 0, "reloads": 0, "column_loads": 0}
+
+    def _check_source(self):
+        st = os.stat(self.path)
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if stat_key == self._stat:
+            return
+        with np.load(self.path) as npz:
+            self._columns = npz_column_names(npz)
+            self.ensemble_settings = tuple(float(v) for v in npz["__ensemble__"])
+            self.source_md5 = str(npz["__source_md5__"])
+        self._stat = stat_key
+        self._df = None
+        self.stats["reloads"] += 1
+
+    @property
+    def columns(self) -> list:
+        with self._lock:
+            self._check_source()
+            return list(self._columns)
+
+    @property
+    def dwt_factors(self) -> list:
+        """DWT threshold factors the detection run stored residual z-scores for (dwt_z_<factor> columns)."""
+        return sorted(float(c[len("dwt_z_"):]) for c in self.columns if c.startswith("dwt_z_"))
+
+    def get(self, columns: Optional[list] = None) -> pd.DataFrame:
+        """
+        Returns the key columns plus `columns` (all columns if None).
+        Raises FileNotFoundError if detection has not been run, KeyError for unknown columns.
+        """
+        with self._lock:
+            self._check_source()
+            if columns is None:
+                columns = self._columns
+            unknown = [c for c in columns if c not in self._columns]
+            if unknown:
+                raise KeyError(unknown)
+
+            wanted = [c for c in self._columns if c in KEY_COLUMNS or c in columns]
+            loaded = [] if self._df is None else list(self._df.columns)
+            missing = [c for c in wanted if c not in loaded]
+            if not missing:
+                self.stats["hits"] += 1
+            else:
+                part, _ = read_npz_columns(self.path, missing)
+                self._df = part if self._df is None else pd.concat([self._df, part], axis=1)
+                self._df = self._df[[c for c in self._columns if c in self._df.columns]]
+                self.stats["column_loads"] += len(missing)
+            return self._df[wanted]
+
+
+anomaly_scores = AnomalyScoreStore(ANOMALY_SCORES_PATH)
+
+
+def data_store_stats() -> dict:
+    """Cache hit / reload counters for the shared KPI, anomaly and anomaly score stores."""
+    return {
+        "kpi": dict(kpi_store.stats, version=kpi_store.version),
+        "anomalies": dict(anomaly_store.stats, version=anomaly_store.version),
+        "anomaly_scores": dict(anomaly_scores.stats, source_md5=anomaly_scores.source_md5),
+        "tool_results": tool_results.info(),
+    }
+
+
+class SiteRangeIndex:
+    """
+    Per-site prefix sums of one KPI over the day axis.
+
+    `sums[i, d]` and `counts[i, d]` hold the total and the number of readings
+    of site i on days [0, d), so the mean over any day range is two
+    subtractions per site and the extreme site is one argmax/argmin. A query
+    costs O(sites) instead of filtering and grouping O(rows).
+    """
+
+    def __init__(self, sites, start, day_sums: np.ndarray, day_counts: np.ndarray):
+        self.sites = np.asarray(sites)
+        self.start = pd.Timestamp(start) if len(self.sites) else pd.NaT
+        self.n_days = day_sums.shape[1]
+
+        self.sums = np.zeros((len(self.sites), self.n_days + 1))
+        np.cumsum(day_sums, axis=1, out=self.sums[:, 1:])
+        self.counts = np.zeros((len(self.sites), self.n_days + 1), dtype=np.int64)
+        np.cumsum(day_counts, axis=1, out=self.counts[:, 1:])
+
+        days_with_data = np.flatnonzero(day_counts.sum(axis=0))
+        self.last_day = int(days_with_data[-1]) if days_with_data.size else None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, kpi_name: str) -> "SiteRangeIndex":
+        df = df.dropna(subset=["Date", "Site_ID", kpi_name])
+        if df.empty:
+            return cls([], pd.NaT, np.zeros((0, 0)), np.zeros((0, 0), dtype=np.int64))
+
+        days = df["Date"].values.astype("datetime64[D]")
+        start = days.min()
+        day_idx = (days - start).astype(np.int64)
+        n_days = int(day_idx.max()) + 1
+        site_idx, sites = pd.factorize(df["Site_ID"].astype(str), sort=True)
+
+        flat = site_idx * n_days + day_idx
+        size = len(sites) * n_days
+        day_sums = np.bincount(flat, weights=df[kpi_name].to_numpy(), minlength=size)
+        day_counts = np.bincount(flat, minlength=size)
+        return cls(sites, start, day_sums.reshape(len(sites), n_days), day_counts.reshape(len(sites), n_days))
+
+    @classmethod
+    def from_cube(cls, cube, kpi_name: str) -> "SiteRangeIndex":
+        plane = cube.plane(kpi_name)
+        valid = ~np.isnan(plane)
+        starts = cube.site_starts()
+        if not starts.size:
+            return cls([], pd.NaT, np.zeros((0, 0)), np.zeros((0, 0), dtype=np.int64))
+
+        # Sites are contiguous row blocks, so one reduceat aggregates every site
+        day_sums = np.add.reduceat(np.where(valid, plane, 0.0).astype(np.float64), starts, axis=0)
+        day_counts = np.add.reduceat(valid.astype(np.int64), starts, axis=0)
+        return cls(cube.sites, cube.date(0), day_sums, day_counts)
+
+    def date(self, day: int) -> pd.Timestamp:
+        return self.start + pd.Timedelta(days=int(day))
+
+    def day_range(self, start_date, end_date):
+        return day_slice(self.start, self.n_days, start_date, end_date)
+
+    def site_means(self, lo: int, hi: int):
+        """(sites, means) over days [lo, hi) for the sites that have readings in it."""
+        if hi <= lo:
+            return self.sites[:0], np.zeros(0)
+        counts = self.counts[:, hi] - self.counts[:, lo]
+        has_data = counts > 0
+        sums = self.sums[has_data, hi] - self.sums[has_data, lo]
+        return self.sites[has_data], sums / counts[has_data]
+
+
+def _kpi_source(kpi_name: str):
+    """
+    Where indexes for `kpi_name` are built from: `(cube, None, key)` when a fresh
+    KPI cube holds it, `(None, df, key)` with the shared store frame otherwise.
+    `key` changes whenever the underlying data does. Raises KeyError for
+    unknown KPIs.
+    """
+    cube = load_cube(KPI_CSV_PATH)
+    if cube is not None and kpi_name in cube.kpi_pos:
+        return cube, None, ("cube", cube.file_key)
+    df = kpi_store.get([kpi_name])
+    return None, df, ("csv", kpi_store.version)
+
+
+class _IndexCache:
+    """Derived per-KPI structures, rebuilt when their source data changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key, source_key, build):
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == source_key:
+                return cached[1]
+            value = build()
+            self._entries[key] = (source_key, value)
+            return value
+
+
+_site_range_indexes = _IndexCache()
+
+
+def site_range_index(kpi_name: str) -> SiteRangeIndex:
+    """
+    Prefix-sum index for `kpi_name`, built from the KPI cube when it is fresh and
+    from the shared KPI store otherwise. Rebuilt only when the underlying data
+    changes. Raises KeyError for unknown KPIs.
+    """
+    cube, df, source_key = _kpi_source(kpi_name)
+    return _site_range_indexes.get(
+        kpi_name, source_key,
+        lambda: SiteRangeIndex.from_cube(cube, kpi_name) if cube is not None else SiteRangeIndex.from_frame(df, kpi_name),
+    )
+
+
+class RangeExtremeTable:
+    """
+    Sparse table over one site's (sector x day) block of a KPI that returns the
+    cell holding the maximum (or minimum) of any day range in O(1).
+
+    Level 0 keeps the best sector of every day; level j the best cell of every
+    2**j-day window. Ties go to the lowest (sector, day) position, i.e. the
+    first matching row in file order, which is what idxmax/idxmin return.
+    """
+
+    def __init__(self, block: np.ndarray, lowest: bool = False):
+        n_sectors, self.n_days = block.shape
+        values = -block.astype(np.float64) if lowest else block.astype(np.float64)
+        values = np.where(np.isnan(values), -np.inf, values)
+        self.lowest = lowest
+
+        if n_sectors == 0:
+            values = np.full((1, self.n_days), -np.inf)
+        days = np.arange(self.n_days)
+        best_sector = np.argmax(values, axis=0)
+        level_values = values[best_sector, days]
+        level_keys = best_sector * self.n_days + days
+        self._levels = [(level_values, level_keys)]
+
+        width = 1
+        while 2 * width <= self.n_days:
+            prev_values, prev_keys = self._levels[-1]
+            left_v, left_k = prev_values[:-width], prev_keys[:-width]
+            right_v, right_k = prev_values[width:], prev_keys[width:]
+            take_right = (right_v > left_v) | ((right_v == left_v) & (right_k < left_k))
+            self._levels.append((np.where(take_right, right_v, left_v), np.where(take_right, right_k, left_k)))
+            width *= 2
+
+        days_with_data = np.flatnonzero(np.isfinite(level_values))
+        self.last_day = int(days_with_data[-1]) if days_with_data.size else None
+
+    def query(self, lo: int, hi: int):
+        """(sector_offset, day, value) of the extreme over days [lo, hi), or None if there is no data."""
+        if hi <= lo:
+            return None
+        level = (hi - lo).bit_length() - 1
+        values, keys = self._levels[level]
+        right = hi - (1 << level)
+        if values[right] > values[lo] or (values[right] == values[lo] and keys[right] < keys[lo]):
+            value, key = values[right], keys[right]
+        else:
+            value, key = values[lo], keys[lo]
+        if not np.isfinite(value):
+            return None
+        sector_offset, day = divmod(int(key), self.n_days)
+        return sector_offset, day, float(-value if self.lowest else value)
+
+
+_kpi_grids = _IndexCache()
+_peak_tables = _IndexCache()
+
+
+def kpi_grid(kpi_name: str):
+    """
+    Sector x day grid holding `kpi_name`: the memory-mapped cube when it is
+    fresh, otherwise an in-memory KPICube built once per data version from the
+    shared store. Raises KeyError for unknown KPIs.
+    """
+    cube, df, source_key = _kpi_source(kpi_name)
+    if cube is not None:
+        return cube, source_key
+    return _kpi_grids.get(kpi_name, source_key, lambda: KPICube.from_frame(df, [kpi_name])), source_key
+
+
+def peak_kpi_row(site_id: str, kpi_name: str, lowest: bool = False, start_date=None, end_date=None) -> Optional[dict]:
+    """
+    Row holding the highest (or lowest) `kpi_name` of `site_id` between
+    start_date and end_date (inclusive; open ends default to the site's data
+    range). Returns None if the site has no readings in that window.
+    """
+    grid, source_key = kpi_grid(kpi_name)
+    if site_id not in grid.site_bounds:
+        return None
+    table = _peak_tables.get(
+        (kpi_name, site_id, lowest), source_key,
+        lambda: RangeExtremeTable(grid.plane(kpi_name)[grid.site_rows(site_id)], lowest),
+    )
+    lo, hi = 0, grid.n_days
+    if start_date is not None or end_date is not None:
+        lo, hi = grid.day_range(
+            grid.date(0) if start_date is None else start_date,
+            grid.date(grid.n_days - 1) if end_date is None else end_date,
+        )
+    found = table.query(lo, hi)
+    if found is None:
+        return None
+    sector_offset, day, value = found
+    return {
+        "Date": grid.date(day),
+        "Site_ID": site_id,
+        "Sector_ID": grid.sectors[grid.site_rows(site_id).start + sector_offset],
+        kpi_name: value,
+    }
+
+
+class KPIVocabulary:
+    """KPI names, site / sector IDs and date range of the KPI data, rebuilt when the CSV changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self.kpis, self.sites, self.sectors = [], set(), set()
+        self.first_date = self.last_date = pd.NaT
+
+    def get(self) -> "KPIVocabulary":
+        with self._lock:
+            df = kpi_store.get([])
+            if self._version is None or self._version != kpi_store.version:
+                self.kpis = [c for c in kpi_store.columns if c not in KEY_COLUMNS]
+                self.sites = set(df["Site_ID"].dropna().astype(str))
+                self.sectors = set(df["Sector_ID"].dropna().astype(str))
+                self.first_date, self.last_date = df["Date"].min(), df["Date"].max()
+                self._version = kpi_store.version
+            return self
+
+
+kpi_vocabulary = KPIVocabulary()
+
+
+def data_version() -> tuple:
+    """(mtime_ns, size) of every data file the tools read; changes whenever one of them is rewritten."""
+    version = []
+    for path in (KPI_CSV_PATH, ANOMALY_CSV_PATH, ANOMALY_SCORES_PATH, GRANGER_RESULTS_PATH):
+        try:
+            st = os.stat(path)
+            version.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            version.append(None)
+    return tuple(version)
+
+
+_SITE_ARG_RE = re.compile(r"^site[\s_-]*0*(\d{1,4})$", re.IGNORECASE)
+_SECTOR_ARG_RE = re.compile(r"^site[\s_-]*0*(\d{1,4})[\s_-]*sector[\s_-]*([a-z])$", re.IGNORECASE)
+_DOTTED_DATE_RE = re.compile(r"^(\d{1,2})\.(\d{1,2})\.(\d{2}|\d{4})$")
+
+_KPI_ARGS = ("kpi_name", "target_kpi", "kpi_x", "kpi_y")
+
+# Tools whose missing dates mean "the whole data range"
+_OPEN_RANGE_TOOLS = {"kpi_anomalies", "compare_kpi_impact", "get_anomaly_cooccurrence",
+                     "get_anomaly_precursors", "get_top_anomalies"}
+# Tools whose missing end date is the last day with data and missing start date N days before it
+_WINDOW_TOOLS = {"get_site_kpi_extreme": 7, "get_kpi_leaderboard": 7, "get_peak_kpi_day_for_site": 30}
+
+
+def _canonical_kpi(name: str, kpis: list) -> str:
+    lookup = {k.lower(): k for k in kpis}
+    kpi = lookup.get(str(name).strip().lower().replace(" ", "_"))
+    if kpi is None:
+        raise ValueError(f"Unknown KPI `{name}`. Valid KPIs: {', '.join(kpis)}.")
+    return kpi
+
+
+def _canonical_id(value: str) -> str:
+    value = str(value).strip()
+    sector = _SECTOR_ARG_RE.match(value)
+    if sector:
+        return f"SITE_{int(sector.group(1)):03d}_SECTOR_{sector.group(2).upper()}"
+    site = _SITE_ARG_RE.match(value)
+    if site:
+        return f"SITE_{int(site.group(1)):03d}"
+    return value
+
+
+def _parse_date_arg(value) -> Optional[pd.Timestamp]:
+    """Timestamp of a date argument ("YYYY-MM-DD", "DD.MM.YY", ...); None for empty values."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    text = str(value).strip()
+    dotted = _DOTTED_DATE_RE.match(text)
+    if dotted:
+        day, month, year = dotted.groups()
+        parsed = pd.Timestamp(year=int(year) + (2000 if len(year) == 2 else 0), month=int(month), day=int(day))
+    else:
+        parsed = pd.to_datetime(text, errors="coerce")
+    if pd.isna(parsed):
+        raise ValueError(f"Could not parse date `{value}`; use YYYY-MM-DD or DD.MM.YY.")
+    return pd.Timestamp(parsed)
+
+
+def _format_date_arg(date: Optional[pd.Timestamp]) -> Optional[str]:
+    if date is None:
+        return None
+    return date.strftime("%Y-%m-%d") if date == date.normalize() else date.isoformat()
+
+
+def _default_end_date(tool_name: str, args: dict) -> Optional[pd.Timestamp]:
+    """The end date `tool_name` uses when none is given (the last day with data in its scope)."""
+    try:
+        if tool_name == "get_kpi_leaderboard":
+            kpis = kpi_vocabulary.get().kpis if args.get("kpi_names") == "all" else args["kpi_names"]
+            days = []
+            for kpi in kpis:
+                grid, _ = kpi_grid(kpi)
+                day = grid.last_day(kpi)
+                if day is not None:
+                    days.append(grid.date(day))
+            return max(days) if days else None
+        grid, _ = kpi_grid(args["kpi_name"])
+        site_id = args.get("site_id") if tool_name == "get_peak_kpi_day_for_site" else None
+        if site_id is not None and site_id not in grid.site_bounds:
+            return None
+        day = grid.last_day(args["kpi_name"], site_id)
+        return None if day is None else grid.date(day)
+    except (KeyError, TypeError):
+        return None
+
+
+def normalize_tool_args(tool_name: str, args: dict) -> dict:
+    """
+    Canonical arguments of a tool call: KPI names in their column spelling,
+    site / sector IDs as SITE_001 / SITE_001_SECTOR_A, extreme_type as
+    "highest" / "lowest", dates as YYYY-MM-DD (DD.MM.YY read day first) and
+    dates that equal the tool's own default dropped, so equivalent calls share
+    one cache entry. Raises ValueError for unknown KPIs, unparseable dates and
+    DWT threshold factors the anomaly scores were not computed for.
+    """
+    args = dict(args)
+    vocab = kpi_vocabulary.get()
+
+    for name in _KPI_ARGS:
+        if args.get(name):
+            args[name] = _canonical_kpi(args[name], vocab.kpis)
+    if "kpi_names" in args:
+        names = args["kpi_names"]
+        if isinstance(names, str):
+            names = "all" if names.strip().lower() == "all" else [k for k in names.split(",") if k.strip()]
+        if names != "all":
+            names = [_canonical_kpi(k, vocab.kpis) for k in names]
+        args["kpi_names"] = names
+    for name in ("site_id", "sector_id"):
+        if args.get(name):
+            args[name] = _canonical_id(args[name])
+    if "extreme_type" in args:
+        args["extreme_type"] = "lowest" if str(args["extreme_type"]).strip().lower() == "lowest" else "highest"
+    if "dummy_input" in args:
+        args["dummy_input"] = None
+    if args.get("dwt_threshold") is not None:
+        args["dwt_threshold"] = float(args["dwt_threshold"])
+        factors = anomaly_scores.dwt_factors if os.path.exists(ANOMALY_SCORES_PATH) else []
+        if factors and args["dwt_threshold"] not in factors:
+            raise ValueError(
+                f"No DWT scores for threshold factor {args['dwt_threshold']:g}. Available factors: "
+                f"{', '.join(f'{f:g}' for f in factors)} (add more with anomaly_detection.py "
+                f"--dwt-threshold / --ensemble-threshold)."
+            )
+
+    if "start_date" in args or "end_date" in args:
+        start, end = _parse_date_arg(args.get("start_date")), _parse_date_arg(args.get("end_date"))
+        if tool_name in _OPEN_RANGE_TOOLS:
+            if start is not None and start <= vocab.first_date:
+                start = None
+            if end is not None and end >= vocab.last_date:
+                end = None
+        elif tool_name in _WINDOW_TOOLS:
+            default_end = _default_end_date(tool_name, args)
+            if end is not None and end == default_end:
+                end = None
+            window_end = end if end is not None else default_end
+            if start is not None and window_end is not None and \
+                    start == window_end - timedelta(days=_WINDOW_TOOLS[tool_name]):
+                start = None
+        args["start_date"], args["end_date"] = _format_date_arg(start), _format_date_arg(end)
+    return args
+
+
+# Results of every tool below, keyed by canonical arguments and data version
+tool_results = ToolResultCache(data_version, normalize_tool_args, max_entries=1024)
 
-KPI_CSV_PATH = "Data\KPI_data_cleaned.csv"
 
 @tool(return_direct=True)
+@tool_results.memoize
 def get_site_kpi_extreme(
     kpi_name: str,
     extreme_type: str = "highest",
@@ -36,40 +730,33 @@ def get_site_kpi_extreme(
     """
 
     try:
-        df = pd.read_csv(KPI_CSV_PATH)
-
-        # Parse and clean Date column
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-        df = df.dropna(subset=["Date", "Site_ID", kpi_name])
+        index = site_range_index(kpi_name)
 
         # Parse date strings
         if end_date:
             end_date = pd.to_datetime(end_date, errors="coerce")
         else:
-            end_date = df["Date"].max()
+            end_date = index.date(index.last_day) if index.last_day is not None else pd.NaT
 
         if start_date:
             start_date = pd.to_datetime(start_date, errors="coerce")
         else:
             start_date = end_date - timedelta(days=7)
 
-        # Filter by date range
-        filtered = df[(df["Date"] >= start_date) & (df["Date"] <= end_date)]
+        # Average KPI by site from the prefix sums
+        sites, means = index.site_means(*index.day_range(start_date, end_date))
 
-        if filtered.empty:
+        if len(sites) == 0:
             return f"No data available for `{kpi_name}` between {start_date.date()} and {end_date.date()}."
 
-        # Calculate average KPI by site
-        avg_kpi = filtered.groupby("Site_ID")[kpi_name].mean()
-
         if extreme_type.lower() == "lowest":
-            site_id = avg_kpi.idxmin()
-            value = avg_kpi.min()
+            best = np.argmin(means)
             direction = "lowest"
         else:
-            site_id = avg_kpi.idxmax()
-            value = avg_kpi.max()
+            best = np.argmax(means)
             direction = "highest"
+        site_id = sites[best]
+        value = means[best]
 
         return (
             f"Between **{start_date.date()}** and **{end_date.date()}**, "
@@ -79,7 +766,106 @@ def get_site_kpi_extreme(
     except Exception as e:
         return f"Error processing KPI data: {str(e)}"
 
+def _top_k_positions(values: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k largest values, largest first, via argpartition instead of a full sort."""
+    k = min(k, len(values))
+    if k == 0:
+        return np.zeros(0, dtype=np.intp)
+    top = np.argpartition(-values, k - 1)[:k]
+    return top[np.argsort(-values[top], kind="stable")]
+
+
+def kpi_leaderboard(kpi_names=None, start_date=None, end_date=None, top_k: int = 5):
+    """
+    Top-k and bottom-k sites by average value for several KPIs at once.
+
+    All per-site means come from a single groupby over the date window. Returns
+    `(start_date, end_date, {kpi: {"top": DataFrame, "bottom": DataFrame}})`.
+    Raises KeyError for unknown KPIs.
+    """
+    if kpi_names is None:
+        kpi_names = [c for c in kpi_store.columns if c not in KEY_COLUMNS]
+    df = kpi_store.get(kpi_names)
+
+    if end_date:
+        end_date = pd.to_datetime(end_date, errors="coerce")
+    else:
+        end_date = df.dropna(subset=kpi_names, how="all")["Date"].max()
+
+    if start_date:
+        start_date = pd.to_datetime(start_date, errors="coerce")
+    else:
+        start_date = end_date - timedelta(days=7)
+
+    filtered = df[(df["Date"] >= start_date) & (df["Date"] <= end_date)]
+    site_means = filtered.groupby("Site_ID", observed=True)[kpi_names].mean()
+    sites = site_means.index.astype(str).to_numpy()
+
+    boards = {}
+    for kpi in kpi_names:
+        values = site_means[kpi].to_numpy()
+        has_data = ~np.isnan(values)
+        kpi_sites, kpi_values = sites[has_data], values[has_data]
+        top = _top_k_positions(kpi_values, top_k)
+        bottom = _top_k_positions(-kpi_values, top_k)
+        boards[kpi] = {
+            "top": pd.DataFrame({"Site_ID": kpi_sites[top], kpi: kpi_values[top]}),
+            "bottom": pd.DataFrame({"Site_ID": kpi_sites[bottom], kpi: kpi_values[bottom]}),
+        }
+    return start_date, end_date, boards
+
+
+@tool(return_direct=True)
+@tool_results.memoize
+def get_kpi_leaderboard(
+    kpi_names: Union[List[str], str] = "all",
+    start_date: str = None,
+    end_date: str = None,
+    top_k: int = 5
+) -> str:
+    """
+    Returns the top-k and bottom-k sites by average value for one or more KPIs
+    in a single call. Use this instead of calling get_site_kpi_extreme once per KPI.
+
+    Parameters:
+    - kpi_names: List of KPI columns (e.g., ["SINR", "RTT"]) or "all" (default: "all").
+    - start_date, end_date: Optional date range in "YYYY-MM-DD" or "DD.MM.YY" format
+      (default: the last 7 days of data).
+    - top_k: Number of sites in each table (default: 5).
+
+    Start Date is 2024-01-01
+    Last Date is 2024-02-29
+
+    Valid KPI columns include:
+    RSRP, SINR, DL_Throughput, RTT, UL_Throughput, CPU_Utilization,
+    Call_Drop_Rate, Active_Users, Handover_Success_Rate, Packet_Loss.
+    """
+    try:
+        if isinstance(kpi_names, str):
+            kpi_names = None if kpi_names.strip().lower() == "all" else [k.strip() for k in kpi_names.split(",")]
+
+        start_date, end_date, boards = kpi_leaderboard(kpi_names, start_date, end_date, top_k)
+
+        if all(board["top"].empty for board in boards.values()):
+            return f"No data available between {start_date.date()} and {end_date.date()}."
+
+        summary = f"**KPI Leaderboard** ({start_date.date()} to {end_date.date()}, top {top_k})\n\n"
+        for kpi, board in boards.items():
+            summary += f"**{kpi}**\n"
+            summary += "| Rank | Highest site | Avg | Lowest site | Avg |\n|---|---|---|---|---|\n"
+            for rank in range(max(len(board["top"]), len(board["bottom"]))):
+                top_site, top_value = board["top"].iloc[rank] if rank < len(board["top"]) else ("", np.nan)
+                low_site, low_value = board["bottom"].iloc[rank] if rank < len(board["bottom"]) else ("", np.nan)
+                summary += f"| {rank + 1} | `{top_site}` | {top_value:.2f} | `{low_site}` | {low_value:.2f} |\n"
+            summary += "\n"
+
+        return summary.strip()
+
+    except Exception as e:
+        return f"Error processing KPI data: {str(e)}"
+
 @tool(return_direct=True)
+@tool_results.memoize
 def get_peak_kpi_day_for_site(
     site_id: str,
     kpi_name: str = "DL_Throughput",
@@ -111,41 +897,37 @@ def get_peak_kpi_day_for_site(
     """
 
     try:
-        df = pd.read_csv(KPI_CSV_PATH)
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-        df = df.dropna(subset=["Date", "Site_ID", kpi_name])
+        grid, source_key = kpi_grid(kpi_name)
+        if site_id not in grid.site_bounds:
+            return f"No data found for site `{site_id}`."
 
-        # Filter for the specified site
-        site_df = df[df["Site_ID"] == site_id]
-        if site_df.empty:
+        lowest = extreme_type.lower() == "lowest"
+        label = "lowest" if lowest else "highest"
+        table = _peak_tables.get(
+            (kpi_name, site_id, lowest), source_key,
+            lambda: RangeExtremeTable(grid.plane(kpi_name)[grid.site_rows(site_id)], lowest),
+        )
+        if table.last_day is None:
             return f"No data found for site `{site_id}`."
 
         # Handle date filtering
         if end_date:
             end_date = pd.to_datetime(end_date, errors="coerce")
         else:
-            end_date = site_df["Date"].max()
+            end_date = grid.date(table.last_day)
 
         if start_date:
             start_date = pd.to_datetime(start_date, errors="coerce")
         else:
             start_date = end_date - timedelta(days=30)
 
-        site_df = site_df[(site_df["Date"] >= start_date) & (site_df["Date"] <= end_date)]
-
-        if site_df.empty:
-            return f"No data found for `{site_id}` between {start_date.date()} and {end_date.date()}."
-
         # Find the day with highest or lowest KPI
-        if extreme_type.lower() == "lowest":
-            peak_row = site_df.loc[site_df[kpi_name].idxmin()]
-            label = "lowest"
-        else:
-            peak_row = site_df.loc[site_df[kpi_name].idxmax()]
-            label = "highest"
+        peak = peak_kpi_row(site_id, kpi_name, lowest, start_date, end_date)
+        if peak is None:
+            return f"No data found for `{site_id}` between {start_date.date()} and {end_date.date()}."
 
-        date = peak_row["Date"].date()
-        value = peak_row[kpi_name]
+        date = peak["Date"].date()
+        value = peak[kpi_name]
 
         return (
             f" On **{date}**, site `{site_id}` had the {label} **{kpi_name}** of **{value:.2f}** "
@@ -155,17 +937,315 @@ def get_peak_kpi_day_for_site(
     except Exception as e:
         return f"Error processing request: {str(e)}"
     
+GRANGER_RESULTS_PATH = os.path.join("Data", "granger_results.npz")
+ALL_SITES_SCOPE = "ALL"
+
+
+def granger_ssr_ftest(y: np.ndarray, x: np.ndarray, maxlag: int = 2, lengths: Optional[np.ndarray] = None):
+    """
+    Granger ssr F-tests ("does x help predict y") for many series at once.
+
+    `y` and `x` are (batch, n) arrays (1-D for a single series); row i uses its
+    first `lengths[i]` observations (all n by default). For every lag 1..maxlag
+    the restricted (own lags + constant) and unrestricted (own + x lags +
+    constant) regressions are solved for the whole batch with one stacked QR
+    on lagged design matrices built with sliding_window_view, exactly as
+    statsmodels' grangercausalitytests does per series.
+
+    Returns `(F, p)` arrays of shape (batch, maxlag). Rows that are too short,
+    have a constant regressor or fit perfectly get NaN.
+    """
+    from scipy.stats import f as f_dist
+
+    y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+    x = np.atleast_2d(np.asarray(x, dtype=np.float64))
+    batch, n = y.shape
+    lengths = np.full(batch, n) if lengths is None else np.asarray(lengths)
+
+    f_stat = np.full((batch, maxlag), np.nan)
+    p_value = np.full((batch, maxlag), np.nan)
+    enough = lengths > 3 * maxlag + 1
+    if n <= maxlag:
+        return f_stat, p_value
+
+    for lag in range(1, maxlag + 1):
+        # windows[..., -1] is y_t / x_t, windows[..., -1 - k] the k-th lag
+        y_win = sliding_window_view(y, lag + 1, axis=1)
+        x_win = sliding_window_view(x, lag + 1, axis=1)
+        rows = y_win.shape[1]
+        in_range = (np.arange(rows)[None, :] < (lengths - lag)[:, None]).astype(np.float64)
+
+        target = y_win[..., -1] * in_range
+        own_lags = y_win[..., :-1] * in_range[..., None]
+        x_lags = x_win[..., :-1] * in_range[..., None]
+        const = in_range[..., None]
+
+        restricted = np.concatenate([own_lags, const], axis=2)
+        unrestricted = np.concatenate([own_lags, x_lags, const], axis=2)
+
+        ssr = []
+        for design in (restricted, unrestricted):
+            q, r = np.linalg.qr(design)
+            fitted = np.einsum("bij,bj->bi", q, np.einsum("bij,bi->bj", q, target))
+            ssr.append(((target - fitted) ** 2).sum(axis=1))
+        ssr_restricted, ssr_unrestricted = ssr
+
+        # A constant x (or y) column makes the unrestricted design rank deficient
+        r_diag = np.abs(np.diagonal(r, axis1=1, axis2=2))
+        full_rank = (r_diag > 1e-10 * np.abs(r).max(axis=(1, 2))[:, None]).all(axis=1)
+
+        df_resid = lengths - lag - (2 * lag + 1)
+        centered = target - (target.sum(axis=1) / np.maximum(lengths - lag, 1))[:, None] * in_range
+        tss = (centered ** 2).sum(axis=1)
+        ok = enough & full_rank & (tss > 0) & (ssr_unrestricted / np.where(tss > 0, tss, 1) >= np.finfo(float).eps)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            f_lag = (ssr_restricted - ssr_unrestricted) / ssr_unrestricted / lag * df_resid
+        f_stat[ok, lag - 1] = f_lag[ok]
+        p_value[ok, lag - 1] = f_dist.sf(f_lag[ok], lag, df_resid[ok])
+
+    return f_stat, p_value
+
+
+def granger_best_p_value(y: np.ndarray, x: np.ndarray, maxlag: int = 2) -> float:
+    """Smallest ssr F-test p-value over lags 1..maxlag for a single series pair."""
+    if len(y) <= 3 * maxlag + 1:
+        raise ValueError(
+            "Insufficient observations. Maximum allowable "
+            "lag is {}".format(int((len(y) - 1) / 3) - 1)
+        )
+    _, p_value = granger_ssr_ftest(y, x, maxlag)
+    if np.isnan(p_value).any():
+        raise ValueError("The Granger causality test statistic cannot be computed for this data.")
+    return float(p_value.min())
+
+
+def stack_scopes(df: pd.DataFrame, kpis: list, column: Optional[str] = None):
+    """
+    Stacks every scope of `column` (e.g. Sector_ID; one pooled scope if None)
+    into a NaN-padded array. Returns `(names, values, lengths)` where
+    values[i, :lengths[i], k] is KPI k of scope i in stable date order, the
+    order kpi_impact_stats uses.
+    """
+    df = df.dropna(subset=["Date", "Site_ID"]).sort_values("Date", kind="stable")
+    groups = [(ALL_SITES_SCOPE, df)] if column is None else df.groupby(column, observed=True, sort=True)
+
+    names, blocks = [], []
+    for name, scope_df in groups:
+        names.append(str(name))
+        blocks.append(scope_df[kpis].to_numpy(dtype=np.float64))
+
+    lengths = np.array([len(b) for b in blocks], dtype=np.int64)
+    values = np.full((len(blocks), lengths.max(initial=0), len(kpis)), np.nan)
+    for i, block in enumerate(blocks):
+        values[i, :len(block)] = block
+    return names, values, lengths
+
+
+def pair_impact_stats(values: np.ndarray, lengths: np.ndarray, x: int, y: int, maxlag: int = 2):
+    """
+    kpi_impact_stats for every scope of a stack_scopes() array at once, for
+    KPI column x -> y. Returns `(rising_count, rising_both_count, best_p_value)`
+    arrays; best_p_value is NaN where the Granger test is infeasible.
+    """
+    vx, vy = values[..., x], values[..., y]
+    in_scope = np.arange(values.shape[1])[None, :] < lengths[:, None]
+
+    # Drop rows where either KPI is missing, keeping order (like dropna)
+    valid = in_scope & ~np.isnan(vx) & ~np.isnan(vy)
+    order = np.argsort(~valid, axis=1, kind="stable")
+    vx = np.take_along_axis(vx, order, axis=1)
+    vy = np.take_along_axis(vy, order, axis=1)
+    n = valid.sum(axis=1)
+
+    step_in_range = np.arange(max(vx.shape[1] - 1, 0))[None, :] < (n - 1)[:, None]
+    with np.errstate(invalid="ignore"):
+        rising_x = step_in_range & (np.diff(vx, axis=1) > 0)
+        rising_both = rising_x & (np.diff(vy, axis=1) > 0)
+
+    _, p = granger_ssr_ftest(np.nan_to_num(vy), np.nan_to_num(vx), maxlag, lengths=n)
+    # Any infeasible lag leaves NaN, like granger_best_p_value raising
+    return rising_x.sum(axis=1), rising_both.sum(axis=1), p.min(axis=1)
+
+
+def sector_kpi_impact(df: pd.DataFrame, kpi_x: str, kpi_y: str):
+    """
+    Per-sector directional and Granger statistics, combined across sectors.
+
+    Each sector is its own time series, so rows of unrelated sectors are never
+    differenced against each other. All sectors are evaluated together in one
+    batched Granger call. Returns a dict with the sector count, the
+    increase ratio weighted by each sector's number of rising steps, Fisher's
+    combined p-value and the number of individually significant sectors.
+    """
+    names, values, lengths = stack_scopes(df, [kpi_x, kpi_y], "Sector_ID")
+    rising_count, rising_both, p_value = pair_impact_stats(values, lengths, 0, 1)
+
+    tested = ~np.isnan(p_value)
+    combined_p = np.nan
+    if tested.any():
+        from scipy.stats import chi2 as chi2_dist
+
+        # Fisher's method: -2 * sum(ln p) ~ chi2 with 2k degrees of freedom
+        p_tested = np.clip(p_value[tested], np.finfo(float).tiny, 1.0)
+        combined_p = float(chi2_dist.sf(-2 * np.log(p_tested).sum(), 2 * p_tested.size))
+
+    total_rising = int(rising_count.sum())
+    return {
+        "sectors": len(names),
+        "rising_count": total_rising,
+        "weighted_ratio": rising_both.sum() / total_rising if total_rising else 0,
+        "tested_sectors": int(tested.sum()),
+        "significant_sectors": int((p_value[tested] < 0.05).sum()),
+        "combined_p_value": combined_p,
+    }
+
+
+def _format_sector_kpi_impact(kpi_x, kpi_y, site_id, stats) -> str:
+    scope = f"site `{site_id}`" if site_id else "the network"
+    if stats["rising_count"] == 0:
+        directional_comment = (
+            f"No positive changes in {kpi_x} to evaluate directional effect on {kpi_y}."
+        )
+    else:
+        ratio = stats["weighted_ratio"]
+        directional_comment = (
+            f"Across **{stats['sectors']} sectors** of {scope} (each sector analysed as its own time series), "
+            f"when **{kpi_x} increases**, **{kpi_y} increases** {ratio * 100:.1f}% of the time "
+            f"(weighted by the number of {kpi_x} increases per sector). "
+            f"This suggests a {'likely' if ratio > 0.45 else 'weak'} directional relationship."
+        )
+
+    if stats["tested_sectors"] == 0:
+        return directional_comment + "\n\n" + "**Granger Causality Test**: Not enough data in any sector to run the test.\n"
+
+    combined_p = stats["combined_p_value"]
+    granger_comment = (
+        f"**Granger Causality Test (per sector)**: Examining whether changes in `{kpi_x}` help predict future changes in `{kpi_y}`.\n"
+        f"→ {stats['significant_sectors']} of {stats['tested_sectors']} sectors are individually significant (p < 0.05).\n"
+        f"→ Fisher's combined p-value is **{combined_p:.4f}**.\n"
+        + (
+            f"Since the combined p-value is less than 0.05, this suggests that changes in **`{kpi_x}` likely help predict future values of `{kpi_y}`** across the sectors.\n"
+            if combined_p < 0.05 else
+            f"Since the combined p-value is greater than 0.05, there is **no statistical evidence** that `{kpi_x}` helps predict `{kpi_y}`.\n"
+        )
+    )
+    return directional_comment + "\n\n" + granger_comment + f"Answer the quetion with general knowedge with the above results as proof with numbers."
+
+
+def kpi_impact_stats(df: pd.DataFrame, kpi_x: str, kpi_y: str):
+    """
+    Directional-increase and Granger statistics for rows already filtered to one
+    scope and date window. Returns `(rising_x_count, conditional_prob, best_p_value)`
+    where conditional_prob is P(ΔY > 0 | ΔX > 0) (0 when X never rises) and
+    best_p_value is the smallest ssr F-test p-value over lags 1..2.
+    """
+    # Stable, so rows sharing a date keep file order and results are reproducible
+    df = df.sort_values("Date", kind="stable")
+    df = df[[kpi_x, kpi_y]].dropna()
+
+    # Directional probability logic
+    delta_x = df[kpi_x].diff()
+    delta_y = df[kpi_y].diff()
+    valid = delta_x.notna() & delta_y.notna()
+    rising_x = valid & (delta_x > 0)
+    rising_both = rising_x & (delta_y > 0)
+    rising_count = int(rising_x.sum())
+    conditional_prob = rising_both.sum() / rising_count if rising_count else 0
+
+    # Granger causality test (maxlag=2)
+    best_p_value = granger_best_p_value(df[kpi_y].to_numpy(), df[kpi_x].to_numpy(), maxlag=2)
+    return rising_count, conditional_prob, best_p_value
+
+
+def _format_kpi_impact(kpi_x, kpi_y, site_id, rising_count, conditional_prob, best_p_value) -> str:
+    if rising_count == 0:
+        directional_comment = (
+            f"No positive changes in {kpi_x} to evaluate directional effect on {kpi_y}."
+        )
+    else:
+        directional_comment = (
+            f"When **{kpi_x} increases**, **{kpi_y} increases** "
+            f"{conditional_prob * 100:.1f}% of the time over the selected period "
+            f"{'for site `' + site_id + '`' if site_id else '(all sites)'}. "
+            f"This suggests a {'likely' if conditional_prob > 0.45 else 'weak'} directional relationship."
+        )
+
+    granger_comment = (
+        f"**Granger Causality Test**: Examining whether changes in `{kpi_x}` help predict future changes in `{kpi_y}`.\n"
+        f"→ The p-value is **{best_p_value:.4f}**.\n"
+        + (
+            f"Since the p-value is less than 0.05, this suggests that changes in **`{kpi_x}` likely help predict future values of `{kpi_y}`** (i.e., `{kpi_x}` Granger-causes `{kpi_y}`).\n"
+            if best_p_value < 0.05 else
+            f"Since the p-value is greater than 0.05, there is **no statistical evidence** that `{kpi_x}` helps predict `{kpi_y}`.\n"
+
+        )
+
+    )
+
+    return directional_comment + "\n\n" + granger_comment + f"Answer the quetion with general knowedge with the above results as proof with numbers."
+
+
+class GrangerResults:
+    """
+    Precomputed compare_kpi_impact statistics (see granger_batch.py), indexed
+    as dense [scope, kpi_x, kpi_y] arrays. Scopes are ALL (every site pooled),
+    each Site_ID and each Sector_ID, always over the full date range.
+    """
+
+    def __init__(self, path: str):
+        with np.load(path) as npz:
+            self.source_md5 = str(npz["source_md5"])
+            self.scope_pos = {s: i for i, s in enumerate(npz["scopes"])}
+            self.kpi_pos = {k: i for i, k in enumerate(npz["kpis"])}
+            self.rising_count = npz["rising_count"]
+            self.conditional_prob = npz["conditional_prob"]
+            self.p_value = npz["p_value"]
+
+    def lookup(self, scope: str, kpi_x: str, kpi_y: str):
+        """`(rising_count, conditional_prob, best_p_value)` or None if not precomputed."""
+        try:
+            i, x, y = self.scope_pos[scope], self.kpi_pos[kpi_x], self.kpi_pos[kpi_y]
+        except KeyError:
+            return None
+        if np.isnan(self.p_value[i, x, y]):
+            return None
+        return int(self.rising_count[i, x, y]), float(self.conditional_prob[i, x, y]), float(self.p_value[i, x, y])
+
+
+_granger_results = {}
+
+
+def granger_results() -> Optional[GrangerResults]:
+    """Precomputed results if they were built from the current KPI data, else None."""
+    try:
+        st = os.stat(GRANGER_RESULTS_PATH)
+    except OSError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    if _granger_results.get("key") != key:
+        _granger_results["key"] = key
+        _granger_results["results"] = GrangerResults(GRANGER_RESULTS_PATH)
+    results = _granger_results["results"]
+    return results if results.source_md5 == kpi_store.version else None
+
+
 @tool
+@tool_results.memoize
 def compare_kpi_impact(
     kpi_x: str,
     kpi_y: str,
     site_id: Optional[str] = None,
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None
+    end_date: Optional[str] = None,
+    per_sector: bool = False
 ) -> str:
     """
     Estimates how often an increase in KPI_X is followed by an increase in KPI_Y,
     and performs a Granger Causality test to assess if KPI_X helps predict KPI_Y.
+
+    Set per_sector=True to analyse every sector as its own time series and
+    combine the results (recommended for network-wide or multi-sector site questions).
     
     site id's are always formated as "SITE_001" only.
     Start Date is 2024-01-01
@@ -179,8 +1259,15 @@ def compare_kpi_impact(
     Example: Does an increase in Active_Users lead to an increase in CPU_Utilization?
     """
     try:
-        df = pd.read_csv(KPI_CSV_PATH)
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+        df = kpi_store.get([kpi_x, kpi_y])
+
+        # Full date range: answer from the precomputed matrix when it is current
+        if not start_date and not end_date and not per_sector:
+            results = granger_results()
+            stats = results.lookup(site_id or ALL_SITES_SCOPE, kpi_x, kpi_y) if results else None
+            if stats is not None:
+                return _format_kpi_impact(kpi_x, kpi_y, site_id, *stats)
+
         df = df.dropna(subset=["Date", "Site_ID", kpi_x, kpi_y])
 
         if site_id:
@@ -194,57 +1281,16 @@ def compare_kpi_impact(
         if df.empty:
             return f"No data available for {kpi_x} and {kpi_y}."
 
-        df = df.sort_values("Date")
-        df = df[[kpi_x, kpi_y]].dropna()
+        if per_sector:
+            return _format_sector_kpi_impact(kpi_x, kpi_y, site_id, sector_kpi_impact(df, kpi_x, kpi_y))
 
-        # Directional probability logic
-        df["ΔX"] = df[kpi_x].diff()
-        df["ΔY"] = df[kpi_y].diff()
-
-        valid = df.dropna(subset=["ΔX", "ΔY"])
-        rising_x = valid[valid["ΔX"] > 0]
-        rising_both = rising_x[rising_x["ΔY"] > 0]
-
-        if len(rising_x) == 0:
-            directional_comment = (
-                f"No positive changes in {kpi_x} to evaluate directional effect on {kpi_y}."
-            )
-            directional_ratio = 0
-        else:
-            conditional_prob = len(rising_both) / len(rising_x)
-            directional_ratio = conditional_prob
-            directional_comment = (
-                f"When **{kpi_x} increases**, **{kpi_y} increases** "
-                f"{conditional_prob * 100:.1f}% of the time over the selected period "
-                f"{'for site `' + site_id + '`' if site_id else '(all sites)'}. "
-                f"This suggests a {'likely' if conditional_prob > 0.45 else 'weak'} directional relationship."
-            )
-
-        # Granger causality test (maxlag=2)
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            df_gc = df[[kpi_y, kpi_x]].dropna()  # Granger expects Y first
-            result = grangercausalitytests(df_gc, maxlag=2, verbose=False)
-
-        best_p_value = min([result[lag][0]["ssr_ftest"][1] for lag in result])
-        granger_comment = (
-            f"**Granger Causality Test**: Examining whether changes in `{kpi_x}` help predict future changes in `{kpi_y}`.\n"
-            f"→ The p-value is **{best_p_value:.4f}**.\n"
-            + (
-                f"Since the p-value is less than 0.05, this suggests that changes in **`{kpi_x}` likely help predict future values of `{kpi_y}`** (i.e., `{kpi_x}` Granger-causes `{kpi_y}`).\n"
-                if best_p_value < 0.05 else
-                f"Since the p-value is greater than 0.05, there is **no statistical evidence** that `{kpi_x}` helps predict `{kpi_y}`.\n"
-                
-            )
-
-        )
-
-        return directional_comment + "\n\n" + granger_comment + f"Answer the quetion with general knowedge with the above results as proof with numbers."
+        return _format_kpi_impact(kpi_x, kpi_y, site_id, *kpi_impact_stats(df, kpi_x, kpi_y))
 
     except Exception as e:
         return f"Error evaluating directional KPI impact: {str(e)}"
 
 @tool
+@tool_results.memoize
 def describe_kpi_dataset(dummy_input: Optional[str] = None) -> str:
     """
     Provides a summary of the available KPI dataset, including:
@@ -254,8 +1300,7 @@ def describe_kpi_dataset(dummy_input: Optional[str] = None) -> str:
     - Missing values, mean, min, and max per KPI
     """
     try:
-        df = pd.read_csv(KPI_CSV_PATH)
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+        df = kpi_store.get()
 
         if df.empty:
             return "Dataset appears empty or could not be parsed."
@@ -293,7 +1338,43 @@ def describe_kpi_dataset(dummy_input: Optional[str] = None) -> str:
 
     
     
+_anomaly_indexes = _IndexCache()
+
+
+def anomaly_index() -> AnomalyIndex:
+    """AnomalyIndex over the ensemble anomaly file, rebuilt only when the file changes."""
+    df = anomaly_store.get()
+    return _anomaly_indexes.get("ensemble", ("csv", anomaly_store.version), lambda: AnomalyIndex(df))
+
+
+def kpi_window_mean(kpi_name: str, site_id=None, sector_id=None, start_date=None, end_date=None) -> float:
+    """
+    Mean of `kpi_name` over the matching sectors and inclusive date window (None
+    means unfiltered), sliced from the KPI grid. NaN if nothing matches.
+    """
+    grid, _ = kpi_grid(kpi_name)
+    rows = slice(0, len(grid.sectors))
+    if site_id:
+        rows = grid.site_rows(site_id) if site_id in grid.site_bounds else slice(0, 0)
+    if sector_id:
+        pos = grid.sector_pos.get(sector_id)
+        rows = slice(pos, pos + 1) if pos is not None and rows.start <= pos < rows.stop else slice(0, 0)
+
+    if start_date is None and end_date is None:
+        lo, hi = 0, grid.n_days
+    else:
+        lo, hi = grid.day_range(
+            grid.date(0) if start_date is None else start_date,
+            grid.date(grid.n_days - 1) if end_date is None else end_date,
+        )
+
+    block = grid.plane(kpi_name)[rows, lo:hi]
+    count = np.count_nonzero(~np.isnan(block))
+    return float(np.nansum(block, dtype=np.float64) / count) if count else np.nan
+
+
 @tool
+@tool_results.memoize
 def kpi_anomalies(
     kpi_name: str,
     site_id: Optional[str] = None,
@@ -326,57 +1407,38 @@ def kpi_anomalies(
     - Group classification (e.g., signal, throughput)
     """
     try:
-        df = pd.read_csv("Data/df_ensemble.csv")
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+        if kpi_name not in anomaly_store.columns:
+            return f"No anomaly data found for `{kpi_name}` with given filters."
+        index = anomaly_index()
+        sector_lo, sector_hi = index.sector_range(site_id, sector_id)
+        day_lo, day_hi = index.day_range(
+            pd.to_datetime(start_date, errors="coerce") if start_date else None,
+            pd.to_datetime(end_date, errors="coerce") if end_date else None,
+        )
+        days = np.arange(day_lo, day_hi)
 
-        # Filter
-        df = df[df["KPI"] == kpi_name]
-        if site_id:
-            df = df[df["Site_ID"] == site_id]
-        if sector_id:
-            df = df[df["Sector_ID"] == sector_id]
-        if start_date:
-            df = df[df["Date"] >= pd.to_datetime(start_date, errors="coerce")]
-        if end_date:
-            df = df[df["Date"] <= pd.to_datetime(end_date, errors="coerce")]
-            
-            
+        # Anomalies per day from the index slices
         peak_anomaly_note = ""
-        df_peak_check = df[df["KPI"] == kpi_name]
-
-        # Group by Date
-        daily_counts = df_peak_check.groupby("Date").size().reset_index(name="Anomaly_Count")
-        if not daily_counts.empty:
-            peak_day = daily_counts.loc[daily_counts["Anomaly_Count"].idxmax()]
+        daily_counts = index.daily_counts(kpi_name, days, sector_lo, sector_hi)
+        if daily_counts.sum():
+            peak = int(np.argmax(daily_counts))
             peak_anomaly_note = (
-                f"Most anomalies for `{kpi_name}` occurred on **{peak_day['Date'].date()}** "
-                f"with **{int(peak_day['Anomaly_Count'])} anomalies**.\n\n"
+                f"Most anomalies for `{kpi_name}` occurred on **{index.date(days[peak]).date()}** "
+                f"with **{int(daily_counts[peak])} anomalies**.\n\n"
             )
-
-        if df.empty:
+        else:
             return f"No anomaly data found for `{kpi_name}` with given filters."
 
-        # Load base KPI data to get overall KPI values
-        df_base = pd.read_csv("Data/KPI_data_cleaned.csv")
-        df_base["Date"] = pd.to_datetime(df_base["Date"], errors="coerce")
-
-        # Filter to match anomaly filters
-        df_base = df_base.dropna(subset=[kpi_name])
-        if site_id:
-            df_base = df_base[df_base["Site_ID"] == site_id]
-        if sector_id:
-            df_base = df_base[df_base["Sector_ID"] == sector_id]
-        if start_date:
-            df_base = df_base[df_base["Date"] >= pd.to_datetime(start_date, errors="coerce")]
-        if end_date:
-            df_base = df_base[df_base["Date"] <= pd.to_datetime(end_date, errors="coerce")]
-
-        if df_base.empty:
+        # Baseline KPI average over the same filters
+        kpi_avg = kpi_window_mean(
+            kpi_name, site_id, sector_id,
+            pd.to_datetime(start_date, errors="coerce") if start_date else None,
+            pd.to_datetime(end_date, errors="coerce") if end_date else None,
+        )
+        if np.isnan(kpi_avg):
             return "No base KPI data found to compare anomalies."
 
-        kpi_avg = df_base[kpi_name].mean()
-        anomalies = df.copy()
-        anomaly_values = anomalies[kpi_name].dropna()
+        anomaly_values = pd.Series(index.values(kpi_name, days, sector_lo, sector_hi)).dropna()
 
         above_avg = anomaly_values[anomaly_values > kpi_avg]
         below_avg = anomaly_values[anomaly_values <= kpi_avg]
@@ -405,24 +1467,11 @@ def kpi_anomalies(
         related_kpis = [k for k in Kpis if k != kpi_name]
         related_counts = {}
 
-        # Get all dates where the main KPI had anomalies
-        main_dates = set(df["Date"])
-
-        # Reload full anomaly dataset (not just filtered one)
-        df_full = pd.read_csv("Data/df_ensemble.csv")
-        df_full["Date"] = pd.to_datetime(df_full["Date"], errors="coerce")
-
-        # Apply same site/sector filtering if given
-        if site_id:
-            df_full = df_full[df_full["Site_ID"] == site_id]
-        if sector_id:
-            df_full = df_full[df_full["Sector_ID"] == sector_id]
-
-        # Filter to only dates matching main KPI anomalies
-        df_same_days = df_full[df_full["Date"].isin(main_dates)]
+        # Anomalies of every KPI on the days where the main KPI had anomalies
+        cooccurring = index.cooccurrence(sector_lo, sector_hi, day_lo, day_hi)[index.kpi_pos[kpi_name]]
 
         for rkpi in related_kpis:
-            count = df_same_days[df_same_days["KPI"] == rkpi].shape[0]
+            count = int(cooccurring[index.kpi_pos[rkpi]]) if rkpi in index.kpi_pos else 0
             if count > 0:
                 related_counts[rkpi] = count
 
@@ -455,3 +1504,215 @@ def kpi_anomalies(
         )
     except Exception as e:
         return f"Error analyzing KPI anomalies: {str(e)}"
+
+
+@tool(return_direct=True)
+@tool_results.memoize
+def get_anomaly_cooccurrence(
+    site_id: str = None,
+    sector_id: str = None,
+    start_date: str = None,
+    end_date: str = None,
+    same_sector: bool = False
+) -> str:
+    """
+    Returns the KPI x KPI anomaly co-occurrence matrix for the whole network, one
+    site or one sector in a single call: for every pair, how many anomalies of the
+    column KPI happened on days on which the row KPI also had anomalies.
+
+    Parameters:
+    - site_id: Optional site filter (e.g., "SITE_001").
+    - sector_id: Optional sector filter (e.g., "SITE_001_SECTOR_A").
+    - start_date, end_date: Optional inclusive date range in "YYYY-MM-DD" format.
+    - same_sector: If True, only count anomalies in the same sector on the same day (default: False).
+
+    The diagonal is the number of anomalies of each KPI in the scope.
+    """
+    try:
+        index = anomaly_index()
+        sector_lo, sector_hi = index.sector_range(site_id, sector_id)
+        day_lo, day_hi = index.day_range(
+            pd.to_datetime(start_date, errors="coerce") if start_date else None,
+            pd.to_datetime(end_date, errors="coerce") if end_date else None,
+        )
+        counts = index.cooccurrence(sector_lo, sector_hi, day_lo, day_hi, same_sector)
+        if not counts.diagonal().any():
+            return "No anomaly data found with given filters."
+
+        scope = f"sector `{sector_id}`" if sector_id else f"site `{site_id}`" if site_id else "all sites"
+        summary = (
+            f"**Anomaly Co-occurrence** ({scope}, "
+            f"{'same sector and day' if same_sector else 'same day'})\n\n"
+            f"| Row KPI \\ Column KPI | " + " | ".join(index.kpis) + " |\n"
+            f"|---|" + "---|" * len(index.kpis) + "\n"
+        )
+        for kpi, row in zip(index.kpis, counts):
+            summary += f"| **{kpi}** | " + " | ".join(str(int(v)) for v in row) + " |\n"
+        return summary.strip()
+
+    except Exception as e:
+        return f"Error analyzing anomaly co-occurrence: {str(e)}"
+
+
+def anomaly_precursors(target_kpi: str = None, max_lag: int = 3, site_id: str = None, sector_id: str = None,
+                       start_date=None, end_date=None, same_sector: bool = True, min_support: int = 3) -> pd.DataFrame:
+    """
+    Lagged co-occurrence of every KPI pair from the anomaly index, ranked by lift.
+    One row per (Precursor, Follower) pair with at least `min_support` followed
+    events, optionally only pairs whose follower is `target_kpi`. Self-pairs
+    (recurring anomalies of one KPI) are left out.
+    """
+    index = anomaly_index()
+    if target_kpi is not None and target_kpi not in index.kpi_pos:
+        raise KeyError(f"No anomaly data for KPI '{target_kpi}'")
+    sector_lo, sector_hi = index.sector_range(site_id, sector_id)
+    day_lo, day_hi = index.day_range(start_date, end_date)
+    followed, events, lift = index.lagged_cooccurrence(sector_lo, sector_hi, day_lo, day_hi, max_lag, same_sector)
+
+    x, y = np.nonzero((followed >= max(min_support, 1)) & ~np.eye(len(index.kpis), dtype=bool))
+    pairs = pd.DataFrame({
+        "Precursor": np.array(index.kpis)[x],
+        "Follower": np.array(index.kpis)[y],
+        "Events": events[x],
+        "Followed": followed[x, y],
+        "Confidence": followed[x, y] / events[x],
+        "Lift": lift[x, y],
+    })
+    if target_kpi is not None:
+        pairs = pairs[pairs["Follower"] == target_kpi]
+    return pairs.sort_values(["Lift", "Followed"], ascending=False, kind="stable").reset_index(drop=True)
+
+
+@tool(return_direct=True)
+@tool_results.memoize
+def get_anomaly_precursors(
+    target_kpi: str = None,
+    max_lag: int = 3,
+    site_id: str = None,
+    sector_id: str = None,
+    start_date: str = None,
+    end_date: str = None,
+    same_sector: bool = True,
+    top_k: int = 10
+) -> str:
+    """
+    Ranks likely precursor KPIs: anomalies in KPI X that are followed by anomalies
+    in KPI Y within 1..max_lag days, with counts and lift for every KPI pair.
+
+    Parameters:
+    - target_kpi: Optional KPI whose precursors are wanted (e.g., "Call_Drop_Rate"); all pairs if omitted.
+    - max_lag: Largest gap in days between the X and the Y anomaly (default: 3).
+    - site_id, sector_id: Optional site / sector filter (default: whole network).
+    - start_date, end_date: Optional inclusive date range in "YYYY-MM-DD" format.
+    - same_sector: If True (default) Y must follow in the same sector; if False anywhere in the scope.
+    - top_k: Number of pairs to list (default: 10).
+
+    Lift > 1 means Y follows X more often than Y follows an arbitrary day.
+    Precursor patterns are correlations, not proof of causation.
+    """
+    try:
+        pairs = anomaly_precursors(
+            target_kpi, max_lag, site_id, sector_id,
+            pd.to_datetime(start_date, errors="coerce") if start_date else None,
+            pd.to_datetime(end_date, errors="coerce") if end_date else None,
+            same_sector,
+        )
+        if pairs.empty:
+            return "No lagged anomaly co-occurrences found with given filters."
+
+        scope = f"sector `{sector_id}`" if sector_id else f"site `{site_id}`" if site_id else "all sites"
+        title = f"Precursors of `{target_kpi}`" if target_kpi else "Anomaly Precursors"
+        summary = (
+            f"**{title}** ({scope}, follow-up within 1-{max_lag} days"
+            f"{', same sector' if same_sector else ''})\n\n"
+            "| Rank | Precursor | Followed by | X anomalies | Followed | Confidence | Lift |\n"
+            "|---|---|---|---|---|---|---|\n"
+        )
+        for rank, row in enumerate(pairs.head(top_k).itertuples(index=False), start=1):
+            summary += (
+                f"| {rank} | `{row.Precursor}` | `{row.Follower}` | {row.Events} | {row.Followed} | "
+                f"{row.Confidence:.1%} | {row.Lift:.2f} |\n"
+            )
+        return summary.strip()
+
+    except Exception as e:
+        return f"Error analyzing anomaly precursors: {str(e)}"
+
+
+@tool(return_direct=True)
+@tool_results.memoize
+def get_top_anomalies(
+    kpi_name: str = None,
+    site_id: str = None,
+    sector_id: str = None,
+    start_date: str = None,
+    end_date: str = None,
+    top_k: int = 10,
+    dwt_threshold: float = None,
+    contamination: float = None
+) -> str:
+    """
+    Returns the most severe ensemble anomalies (largest DWT residual z-score),
+    optionally for one KPI, site, sector and date range. The ensemble vote can be
+    re-thresholded on the fly without rerunning detection.
+
+    Parameters:
+    - kpi_name: Optional KPI (e.g., "SINR"); all KPIs if omitted.
+    - site_id, sector_id: Optional site / sector filter.
+    - start_date, end_date: Optional inclusive date range in "YYYY-MM-DD" format.
+    - top_k: Number of anomalies to list (default: 10).
+    - dwt_threshold: Optional DWT threshold factor; only the factors the detection run stored scores for
+      are available (2 and 2.5 by default; default: the ensemble one used by the detection run).
+    - contamination: Optional Isolation Forest contamination, e.g. 0.05 (default: the one used by the detection run).
+    """
+    try:
+        if not os.path.exists(ANOMALY_SCORES_PATH):
+            return "No anomaly scores found. Run `python anomaly_detection.py` first."
+        from anomaly_detection import dwt_column, ensemble_flags
+
+        scores = anomaly_scores.get()
+        default_threshold, default_contamination = anomaly_scores.ensemble_settings
+        threshold = default_threshold if dwt_threshold is None else float(dwt_threshold)
+        contamination = default_contamination if contamination is None else float(contamination)
+
+        if (threshold, contamination) == (default_threshold, default_contamination):
+            mask = scores["ensemble"].to_numpy(dtype=bool, copy=True)
+        else:
+            mask = ensemble_flags(scores, threshold, contamination)
+        if kpi_name:
+            mask &= (scores["KPI"] == kpi_name).to_numpy()
+        if site_id:
+            mask &= (scores["Site_ID"] == site_id).to_numpy()
+        if sector_id:
+            mask &= (scores["Sector_ID"] == sector_id).to_numpy()
+        if start_date:
+            mask &= (scores["Date"] >= pd.to_datetime(start_date, errors="coerce")).to_numpy()
+        if end_date:
+            mask &= (scores["Date"] <= pd.to_datetime(end_date, errors="coerce")).to_numpy()
+
+        flagged = scores[mask]
+        if flagged.empty:
+            return "No anomalies found with given filters."
+        severity = flagged[dwt_column(threshold)].abs()
+        top = flagged.loc[severity.sort_values(ascending=False, kind="stable").index[:top_k]]
+
+        scope = f"sector `{sector_id}`" if sector_id else f"site `{site_id}`" if site_id else "all sites"
+        summary = (
+            f"**Most severe anomalies{f' for `{kpi_name}`' if kpi_name else ''}** ({scope}, "
+            f"{len(flagged)} flagged, DWT threshold {threshold:g}, IF contamination {contamination:.0%})\n\n"
+            "| Rank | Date | Sector | KPI | Value | DWT z-score | IF score |\n|---|---|---|---|---|---|---|\n"
+        )
+        columns = ["Date", "Sector_ID", "KPI", "Value", dwt_column(threshold), "if_score"]
+        for rank, (date, sector, kpi, value, z, if_score) in enumerate(top[columns].itertuples(index=False), start=1):
+            summary += f"| {rank} | {date.date()} | `{sector}` | `{kpi}` | {value:.2f} | {z:.2f} | {if_score:.3f} |\n"
+        return summary.strip()
+
+    except Exception as e:
+        return f"Error ranking anomalies: {str(e)}"
+
+
+# Async versions for ToolNode.ainvoke, which awaits all tool calls of one turn together
+for _tool in [get_site_kpi_extreme, get_kpi_leaderboard, get_peak_kpi_day_for_site, compare_kpi_impact,
+              describe_kpi_dataset, kpi_anomalies, get_anomaly_cooccurrence, get_anomaly_precursors,
+              get_top_anomalies]:
+    _tool.coroutine = _tool.func.async_version(run_in_thread)